@@ -1,5 +1,26 @@
 """
 Imports
+The pipelines are imported on first access, so that importing at16k.api stays cheap.
 """
-from .speech_to_text import SpeechToText
-from .live_speech_to_text import LiveSpeechToText
+import importlib
+import sys
+
+_SUBMODULES = {
+    'SpeechToText': '.speech_to_text',
+    'LiveSpeechToText': '.live_speech_to_text'
+}
+
+__all__ = list(_SUBMODULES)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        module = importlib.import_module(_SUBMODULES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # Module-level __getattr__ (PEP 562) is not available before Python 3.7.
+    from .speech_to_text import SpeechToText
+    from .live_speech_to_text import LiveSpeechToText
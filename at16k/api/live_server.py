@@ -0,0 +1,289 @@
+"""
+Streaming speech-to-text server (asyncio, HTTP/1.1 chunked upload)
+
+Protocol:
+    POST /transcribe?dtype=int16 with the PCM samples as the request body, preferably
+    sent with Transfer-Encoding: chunked. dtype is int16 (default) or float32, little-endian.
+    With rate=<Hz> in the query, audio at another sample rate than the model's is resampled.
+    The response is a chunked stream of JSON lines: {"text": ...} whenever the transcript
+    changes, and {"text": ..., "final": true} once the upload is complete. With endpointing
+    enabled, {"text": ..., "final": true} is also sent for every utterance that ended, and the
+    next events only hold the text of the following utterance. With events=1 in the query,
+    the lines are the partial/final events of LiveSpeechToText.events_from_buffer instead,
+    which only carry the changed end of the transcript. If the upload is
+    malformed or decoding fails, the stream ends with {"error": ...} instead.
+
+    GET /metrics returns the counters of the server's Metrics, if any, in the Prometheus text format.
+"""
+
+import asyncio
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+
+DTYPES = {
+    'int16': '<i2',
+    'float32': '<f4'
+}
+
+READ_SIZE = 8192
+
+# Chunks of READ_SIZE bytes buffered per connection while decoding is busy.
+MAX_PENDING_CHUNKS = 16
+
+# Most bytes handed to a single from_buffer call (1 second of 16 KHz int16 audio).
+MAX_DECODE_BYTES = 32000
+
+
+class HTTPError(Exception):
+    """
+    Error reported to the client as an HTTP status
+    """
+
+    def __init__(self, status, reason):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+async def _read_headers(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, _ = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(400, 'Bad Request')
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return method, target, headers
+
+
+async def _iter_body(reader, headers):
+    """
+    Yield the request body as it arrives
+    """
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            try:
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise HTTPError(400, 'Malformed chunk size')
+            if size == 0:
+                # Skip the (optional) trailer section.
+                while (await reader.readuntil(b'\r\n')) != b'\r\n':
+                    pass
+                return
+            # Large chunks are passed on piece by piece rather than buffered whole.
+            while size > 0:
+                data = await reader.readexactly(min(READ_SIZE, size))
+                size -= len(data)
+                yield data
+            if (await reader.readexactly(2)) != b'\r\n':
+                raise HTTPError(400, 'Malformed chunk')
+    elif 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining > 0:
+            data = await reader.read(min(READ_SIZE, remaining))
+            if not data:
+                return
+            remaining -= len(data)
+            yield data
+    else:
+        while True:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                return
+            yield data
+
+
+class LiveServer:
+    """
+    Serves a LiveSpeechToText instance to many concurrent streams.
+    Each connection keeps its own decoding context; decoding runs in a bounded
+    thread pool so that the event loop only moves bytes.
+    metrics (an at16k.core.metrics.Metrics, usually the one given to the LiveSpeechToText) is
+    served at /metrics.
+    """
+
+    def __init__(self, stt, max_workers=4, max_pending_chunks=MAX_PENDING_CHUNKS,
+                 max_decode_bytes=MAX_DECODE_BYTES, metrics=None):
+        self._stt = stt
+        self._metrics = metrics
+        self._max_pending_chunks = max_pending_chunks
+        self._max_decode_bytes = max_decode_bytes
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._server = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """
+        Start listening; returns the asyncio server
+        """
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    async def close(self):
+        """
+        Stop listening and shut down the thread pool
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+
+    @staticmethod
+    async def _write_status(writer, status, reason):
+        writer.write(('HTTP/1.1 %d %s\r\nContent-Length: 0\r\nConnection: close\r\n\r\n'
+                      % (status, reason)).encode('latin-1'))
+        await writer.drain()
+
+    async def _write_metrics(self, writer):
+        data = self._metrics.to_prometheus().encode('utf-8')
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                     b'Content-Length: %d\r\nConnection: close\r\n\r\n%s' % (len(data), data))
+        await writer.drain()
+
+    @staticmethod
+    async def _write_event(writer, event):
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        writer.write(b'%x\r\n%s\r\n' % (len(data), data))
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, target, headers = await _read_headers(reader)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                raise HTTPError(400, 'Bad Request')
+            url = urlparse(target)
+            if url.path == '/metrics' and self._metrics is not None:
+                if method != 'GET':
+                    raise HTTPError(405, 'Method Not Allowed')
+                await self._write_metrics(writer)
+                writer.close()
+                return
+            if url.path != '/transcribe':
+                raise HTTPError(404, 'Not Found')
+            if method != 'POST':
+                raise HTTPError(405, 'Method Not Allowed')
+            query = parse_qs(url.query)
+            dtype = query.get('dtype', ['int16'])[0]
+            events = query.get('events', ['0'])[0] == '1'
+            if dtype not in DTYPES:
+                raise HTTPError(400, 'Bad Request')
+            try:
+                rate = int(query['rate'][0]) if 'rate' in query else None
+            except ValueError:
+                raise HTTPError(400, 'Bad Request')
+            if rate is not None and rate <= 0:
+                raise HTTPError(400, 'Bad Request')
+        except HTTPError as error:
+            await self._write_status(writer, error.status, error.reason)
+            writer.close()
+            return
+        except ConnectionError:
+            writer.close()
+            return
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                         b'Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n')
+            try:
+                await self._stream(reader, writer, headers, DTYPES[dtype], events, rate)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                # The client went away.
+                return
+            except HTTPError as error:
+                await self._write_event(writer, {'error': error.reason})
+            except Exception as error:  # pylint: disable=broad-except
+                await self._write_event(writer, {'error': repr(error)})
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, reader, writer, headers, dtype, events=False, rate=None):
+        loop = asyncio.get_event_loop()
+        # Bounded, so that a client sending faster than it is decoded is throttled by TCP.
+        queue = asyncio.Queue(maxsize=self._max_pending_chunks)
+        max_bytes = self._max_decode_bytes
+        sample_size = 4 if dtype == '<f4' else 2
+
+        async def receive():
+            try:
+                async for data in _iter_body(reader, headers):
+                    await queue.put(data)
+            finally:
+                await queue.put(None)
+
+        receiver = asyncio.ensure_future(receive())
+        context = None
+        text = ''
+        pending = b''
+        done = False
+        try:
+            while True:
+                if not done and len(pending) < max_bytes:
+                    # Coalesce what was received while the previous chunk was being decoded.
+                    chunks = [await queue.get()]
+                    received = len(pending) + len(chunks[0] or b'')
+                    while chunks[-1] is not None and received < max_bytes and not queue.empty():
+                        chunks.append(queue.get_nowait())
+                        received += len(chunks[-1] or b'')
+                    if chunks[-1] is None:
+                        chunks.pop()
+                        done = True
+                    pending += b''.join(chunks)
+                usable = min(len(pending), max_bytes)
+                usable -= usable % sample_size
+                if not usable:
+                    if done:
+                        break
+                    continue
+                buffer, pending = pending[:usable], pending[usable:]
+                if events:
+                    new_events, context = await loop.run_in_executor(
+                        self._executor, functools.partial(self._stt.events_from_buffer, buffer, context, dtype,
+                                                          sample_rate=rate))
+                    for event in new_events:
+                        await self._write_event(writer, event)
+                    continue
+                new_text, context = await loop.run_in_executor(
+                    self._executor, functools.partial(self._stt.from_buffer, buffer, context, dtype, sample_rate=rate))
+                text = await self._write_update(writer, context, text, new_text)
+            # Re-raises if the upload was cut short or malformed.
+            await receiver
+        finally:
+            receiver.cancel()
+        if events:
+            new_events = []
+            if context is not None:
+                new_events = await loop.run_in_executor(self._executor, self._stt.finish_events, context)
+            for event in new_events:
+                await self._write_event(writer, event)
+            return
+        if rate is not None and context is not None:
+            # Decode the samples the resampler held back.
+            new_text, context = await loop.run_in_executor(self._executor, self._stt.flush, context)
+            text = await self._write_update(writer, context, text, new_text)
+        await self._write_event(writer, {'text': text, 'final': True})
+
+    async def _write_update(self, writer, context, text, new_text):
+        """
+        Send the finals of a context and the new text, if it changed; returns the text sent last
+        """
+        finals = context.get('finals') if isinstance(context, dict) else None
+        if finals:
+            for final in finals:
+                await self._write_event(writer, {'text': final, 'final': True})
+            del finals[:]
+            text = ''
+        if new_text is not None and new_text != text:
+            text = new_text
+            await self._write_event(writer, {'text': text})
+        return text
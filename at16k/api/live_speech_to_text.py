@@ -1,56 +1,192 @@
 """
 Speech-to-text pipeline
 """
+import os
 import numpy as np
-from at16k.core.media import Media
-from at16k.core.live_model import LiveModel
+from at16k.core.media import Media, StreamingResampler
+from at16k.core.registry import REGISTRY
+from at16k.core.live_scheduler import LiveScheduler
+
+
+def _next_event(context, event_type, **fields):
+    seq = context.get('event_seq', 0)
+    context['event_seq'] = seq + 1
+    event = {'type': event_type, 'seq': seq, 'utterance': context.get('event_utterance', 0)}
+    event.update(fields)
+    return event
+
+
+def _make_events(text, context):
+    """
+    Turn the finals and the current text of a context into events, see LiveSpeechToText.events_from_buffer
+    """
+    events = []
+    finals = context.get('finals', [])
+    while finals:
+        events.append(_next_event(context, 'final', text=finals.pop(0)))
+        context['event_utterance'] = context.get('event_utterance', 0) + 1
+        context['event_text'] = ''
+    last_text = context.get('event_text', '')
+    if text != last_text:
+        stable = len(os.path.commonprefix([last_text, text]))
+        events.append(_next_event(context, 'partial', stable=stable, tail=text[stable:]))
+        context['event_text'] = text
+    return events
 
 
 class LiveSpeechToText:
     """
     Live speech-to-text
+
+    Besides full transcripts (from_file, from_buffer), results are available as events
+    (events_from_file, events_from_buffer, finish_events), each with a sequence number seq
+    that increases by one per event of a stream, and the index of its utterance:
+        {"type": "partial", "seq": .., "utterance": .., "stable": n, "tail": ..}: the text of the
+            current utterance is now its first n characters as previously sent, followed by tail
+        {"type": "final", "seq": .., "utterance": .., "text": ..}: complete text of an utterance
+    Utterances other than the last only end with endpointing (see EndpointConfig).
+    metrics (an at16k.core.metrics.Metrics) collects the network run times and beam expansions
+    of the model; instances given the same Metrics share one model.
+    Files and buffers at other sample rates than the model's are resampled.
     """
 
-    def __init__(self, model_name, buffer_size=4096, filter_non_speech=False, faster=True, warm_up=True):
+    def __init__(self, model_name, buffer_size=4096, filter_non_speech=False, faster=True, warm_up=True,
+                 batch_streams=False, max_batch=32, batched_beam=False, backend='tf', fused=False, threads=None,
+                 endpoint=None, metrics=None):
         self._buffer_size = buffer_size
-        self._model = self._load_model(model_name, filter_non_speech, faster)
+        self._model = self._load_model(model_name, filter_non_speech=filter_non_speech, faster=faster,
+                                       batched_beam=batched_beam, backend=backend, fused=fused, threads=threads,
+                                       endpoint=endpoint, metrics=metrics)
         if warm_up:
             self._do_warmup()
+        # With batch_streams, chunks decoded concurrently from several threads are batched together.
+        self._scheduler = LiveScheduler(self._model, max_batch=max_batch) if batch_streams else None
+        # StreamingResampler per input sample rate, shared by all streams.
+        self._resamplers = {}
 
     @staticmethod
-    def _load_model(model_name, filter_non_speech, faster):
-        model = LiveModel(model_name, filter_non_speech=filter_non_speech, faster=faster)
+    def _load_model(model_name, **options):
+        model = REGISTRY.acquire(model_name, live=True, **options)
         return model
 
+    def close(self):
+        """
+        Hand the model back to the registry
+        """
+        if self._scheduler is not None:
+            self._scheduler.close()
+            self._scheduler = None
+        if self._model is not None:
+            REGISTRY.release(self._model)
+            self._model = None
+
     def _do_warmup(self):
-        samples = [0. for _ in range(4096)]
+        samples = np.zeros(4096, dtype=np.float32)
         self._model(samples, None)
 
+    def _decode(self, samples, context):
+        if self._scheduler is not None:
+            return self._scheduler(samples, context)
+        return self._model(samples, context)
+
     def from_file(self, file_path):
         """
         Live transcribe from file
+        With endpointing, every utterance that ended is yielded as {"text": ..., "final": True}.
         """
-        model = self._model
-        media = Media(file_path, dtype=np.float32)
-        samples = media.waveform.ravel().tolist()
-        buffer_size = self._buffer_size
+        media = Media(file_path, dtype=np.float32, sample_rate=self._model.sample_rate)
         context = None
-        while samples:
-            text, context = model(samples[:buffer_size], context)
-            samples = samples[buffer_size:]
+        for samples in media.iter_chunks(self._buffer_size):
+            text, context = self._decode(samples, context)
+            finals = context.get('finals', [])
+            while finals:
+                yield {"text": finals.pop(0), "final": True}
             yield {"text": text}
 
-    def from_buffer(self, buffer, context, dtype='<i2', is_buffer=True):
+    def events_from_file(self, file_path):
+        """
+        Live transcribe from file, yielding events
+        """
+        media = Media(file_path, dtype=np.float32, sample_rate=self._model.sample_rate)
+        context = None
+        for samples in media.iter_chunks(self._buffer_size):
+            text, context = self._decode(samples, context)
+            for event in _make_events(text, context):
+                yield event
+        if context is not None:
+            for event in self.finish_events(context):
+                yield event
+
+    def events_from_buffer(self, buffer, context, dtype='<i2', is_buffer=True, sample_rate=None):
+        """
+        Transcribe from buffer; returns the list of new events and the updated context
+        """
+        text, context = self.from_buffer(buffer, context, dtype=dtype, is_buffer=is_buffer, sample_rate=sample_rate)
+        return _make_events(text, context), context
+
+    def finish_events(self, context):
+        """
+        Events closing a stream: those of the samples still held by the resampler (see flush),
+        then the final event of the utterance in progress, if it has any text
+        """
+        text, context = self.flush(context)
+        events = _make_events(text, context) if text is not None else []
+        text = context.get('event_text', '')
+        if text:
+            events.append(_next_event(context, 'final', text=text))
+            context['event_utterance'] = context.get('event_utterance', 0) + 1
+            context['event_text'] = ''
+        return events
+
+    def from_buffer(self, buffer, context, dtype='<i2', is_buffer=True, sample_rate=None):
         """
         Transcribe from buffer
+        With endpointing, the texts of the utterances that ended are in context['finals'];
+        the caller removes them once handled.
+        sample_rate is that of the buffer, if it differs from the model's; the resampler state is
+        kept in the context, and the last few samples of each buffer wait for the next one.
         """
-        model = self._model
         if is_buffer:
-            samples = np.frombuffer(buffer, dtype=dtype).reshape(-1, 1)
+            samples = np.frombuffer(buffer, dtype=dtype)
             if samples.dtype not in [np.float32]:
-                samples = samples.astype(np.float32) / np.iinfo(samples.dtype).max
-            samples = samples.ravel().tolist()
+                scale = np.iinfo(samples.dtype).max
+                samples = samples.astype(np.float32)
+                samples /= scale
         else:
             samples = buffer
-        text, context = model(samples, context)
+        if sample_rate is not None and sample_rate != self._model.sample_rate:
+            return self._decode_resampled(samples, context, sample_rate)
+        text, context = self._decode(samples, context)
         return text, context
+
+    def _get_resampler(self, sample_rate):
+        resampler = self._resamplers.get(sample_rate)
+        if resampler is None:
+            resampler = self._resamplers[sample_rate] = StreamingResampler(sample_rate, self._model.sample_rate)
+        return resampler
+
+    def _decode_resampled(self, samples, context, sample_rate):
+        # Until the model has decoded any samples, the context only holds the resampler state.
+        state = context if context is not None else {'resampler_only': True}
+        state['resampler_rate'] = sample_rate
+        return self._decode_state(self._get_resampler(sample_rate)(samples, state), state)
+
+    def _decode_state(self, samples, state):
+        if not len(samples):
+            return state.get('resampled_text', ''), state
+        text, context = self._decode(samples, None if state.get('resampler_only') else state)
+        if context is not state:
+            state.pop('resampler_only', None)
+            context.update(state)
+        context['resampled_text'] = text
+        return text, context
+
+    def flush(self, context):
+        """
+        End a stream that from_buffer resampled: decode the samples the resampler still holds.
+        Returns the text and the updated context; the text is None if the stream was not resampled.
+        """
+        if 'resampler_rate' not in context:
+            return None, context
+        samples = self._get_resampler(context['resampler_rate']).flush(context)
+        return self._decode_state(samples, context)
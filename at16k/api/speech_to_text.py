@@ -2,41 +2,116 @@
 Speech-to-text pipeline
 """
 
-from at16k.core.media import Media
-from at16k.core.model import Model
+from at16k.core.media import Media, resample
+from at16k.core.registry import REGISTRY
 from at16k.core.segment import Segment
+from at16k.blocks.segmenter import Segmenter
 from at16k.blocks.transcriber import Transcriber
 
+# Longest input (in seconds) each offline model transcribes reliably.
+MAX_DURATIONS = {
+    'en_8k': 29.5,
+    'en_16k': 14.5
+}
+
+# Sample rate of each offline model; other files are resampled.
+SAMPLE_RATES = {
+    'en_8k': 8000,
+    'en_16k': 16000
+}
+
 
 class SpeechToText():
     """
     Speech-to-text
     """
 
-    def __init__(self, model_name):
-        self._model = self._load_model(model_name)
+    def __init__(self, model_name, max_duration=None, threads=None):
+        self._model = self._load_model(model_name, threads)
+        self._sample_rate = SAMPLE_RATES.get(model_name)
+        if max_duration is None:
+            max_duration = MAX_DURATIONS.get(model_name)
+        self._segmenter = Segmenter(max_duration) if max_duration else None
 
     @staticmethod
-    def _load_model(model_name):
-        model = Model(model_name)
+    def _load_model(model_name, threads):
+        model = REGISTRY.acquire(model_name, threads=threads)
         return model
 
-    def __call__(self, file_path):
-        model = self._model
-        media = Media(file_path)
-        segment = Segment(waveform=media.waveform,
-                          boundaries=(0.0, media.duration),
-                          sample_rate=media.sample_rate,
-                          channel=0)
-        transcriber = Transcriber(model)
-        text, score = transcriber(segment)
+    def close(self):
+        """
+        Hand the model back to the registry
+        """
+        if self._model is not None:
+            REGISTRY.release(self._model)
+            self._model = None
+
+    def _make_segments(self, waveform, sample_rate):
+        if self._segmenter is None:
+            segment = Segment(waveform=waveform,
+                              boundaries=(0.0, len(waveform) / float(sample_rate)),
+                              sample_rate=sample_rate,
+                              channel=0)
+            return [segment]
+        return self._segmenter(waveform, sample_rate, channel=0)
+
+    @staticmethod
+    def _make_result(file_path, segments, outputs):
+        results = []
+        for segment, (text, score) in zip(segments, outputs):
+            results.append({
+                'begin': segment.boundaries[0],
+                'end': segment.boundaries[1],
+                'text': text,
+                'score': score
+            })
         result = {
             'file': file_path,
-            'sample_rate': media.sample_rate,
-            'begin': segment.boundaries[0],
-            'end': segment.boundaries[1],
-            'channel': segment.channel,
-            'text': text,
-            'score': score
+            'sample_rate': segments[0].sample_rate,
+            'begin': segments[0].boundaries[0],
+            'end': segments[-1].boundaries[1],
+            'channel': segments[0].channel,
+            'text': ' '.join(item['text'] for item in results if item['text']),
+            'score': sum(item['score'] for item in results),
+            'segments': results
         }
         return result
+
+    def __call__(self, file_path):
+        return self.batch([file_path])[0]
+
+    def from_waveform(self, waveform, sample_rate=None):
+        """
+        Transcribe a mono waveform with the sample values of 16-bit PCM, e.g. raw audio read from a
+        stream. sample_rate defaults to the model's; waveforms at other rates are resampled.
+        The result has the same fields as for a file, with file set to None.
+        """
+        if sample_rate is None:
+            sample_rate = self._sample_rate
+        elif self._sample_rate is not None and sample_rate != self._sample_rate:
+            waveform = resample(waveform, sample_rate, self._sample_rate)
+            sample_rate = self._sample_rate
+        segments = self._make_segments(waveform, sample_rate)
+        outputs = Transcriber(self._model).batch(segments)
+        return self._make_result(None, segments, outputs)
+
+    def batch(self, file_paths, max_batch=16):
+        """
+        Transcribe several files, grouping segments of similar duration into one prediction call.
+        Files longer than the model's duration limit are split into segments at low-energy points.
+        Results are returned in the same order as file_paths.
+        """
+        model = self._model
+        file_segments = []
+        for file_path in file_paths:
+            media = Media(file_path, sample_rate=self._sample_rate)
+            file_segments.append(self._make_segments(media.waveform, media.sample_rate))
+        segments = [segment for item in file_segments for segment in item]
+        transcriber = Transcriber(model)
+        outputs = transcriber.batch(segments, max_batch=max_batch)
+        results = []
+        offset = 0
+        for file_path, item in zip(file_paths, file_segments):
+            results.append(self._make_result(file_path, item, outputs[offset:(offset + len(item))]))
+            offset += len(item)
+        return results
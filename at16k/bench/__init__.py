@@ -0,0 +1,4 @@
+"""
+Benchmarks: real-time factor, first-partial latency, model load time and peak memory.
+Run with at16k-bench (see at16k.bench.runner).
+"""
@@ -0,0 +1,198 @@
+"""
+Benchmark runner (command-line)
+
+For every model and every input with the model's sample rate, measures:
+    load_time: seconds to load the model
+    elapsed, rtf: processing seconds per run and real-time factor (elapsed / audio duration)
+    first_partial: live models only, processing seconds until the first non-empty partial result
+    peak_rss_mb: peak resident memory while loading the model and transcribing the input
+Each model, decoding mode and input runs in a new process, so that load time and memory are its own.
+Results are written to a JSON file, together with the commit and platform, so that runs can be
+compared across commits.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import scipy.io.wavfile as wavfile
+
+import at16k
+from at16k.core.media import Media
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'samples')
+
+SAMPLE_RATES = {
+    'en_8k': 8000,
+    'en_16k': 16000,
+    'en_16k_rnnt': 16000
+}
+
+LIVE_MODELS = ['en_16k_rnnt']
+
+PARSER = argparse.ArgumentParser('at16k Benchmark')
+PARSER.add_argument('-m', '--models', type=str, nargs='+', default=sorted(SAMPLE_RATES),
+                    choices=sorted(SAMPLE_RATES))
+PARSER.add_argument('-i', '--inputs', type=str, nargs='+',
+                    help='WAV files to transcribe. Defaults to the files in samples/ of a source checkout.')
+PARSER.add_argument('--long-seconds', type=float, default=60.,
+                    help='Also benchmark each input repeated up to this duration (0 to disable).')
+PARSER.add_argument('--decode', type=str, nargs='+', default=['greedy', 'beam'], choices=['greedy', 'beam'],
+                    help='Decoding modes of the live models.')
+PARSER.add_argument('--buffer-size', type=int, default=4096,
+                    help='Samples per chunk fed to the live models.')
+PARSER.add_argument('--repeat', type=int, default=3,
+                    help='Runs per input; the fastest run is reported.')
+PARSER.add_argument('-o', '--out', type=str, default='benchmark.json')
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the current process since it started, in MB
+    """
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak / (1024. * 1024.) if sys.platform == 'darwin' else peak / 1024.
+
+
+def synthesize_long(file_path, seconds, out_dir):
+    """
+    Write file_path repeated until it lasts at least seconds; returns the new path
+    """
+    sample_rate, data = wavfile.read(file_path)
+    repeats = int(np.ceil(seconds * sample_rate / float(len(data))))
+    name = '%s_x%d.wav' % (os.path.splitext(os.path.basename(file_path))[0], repeats)
+    out_path = os.path.join(out_dir, name)
+    wavfile.write(out_path, sample_rate, np.concatenate([data] * repeats))
+    return out_path
+
+
+def measure_offline(stt, file_path, duration, repeat=1):
+    """
+    Transcribe file_path with a SpeechToText repeat times; returns the fastest run
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stt(file_path)
+        timings.append(time.perf_counter() - start)
+    elapsed = min(timings)
+    return {'elapsed': elapsed, 'rtf': elapsed / duration}
+
+
+def measure_live(stt, file_path, duration, repeat=1):
+    """
+    Stream file_path through a LiveSpeechToText repeat times; returns the fastest run and the
+    processing time until the first non-empty partial result
+    """
+    timings = []
+    first_partials = []
+    for _ in range(repeat):
+        first_partial = None
+        start = time.perf_counter()
+        for result in stt.from_file(file_path):
+            if first_partial is None and result['text']:
+                first_partial = time.perf_counter() - start
+        timings.append(time.perf_counter() - start)
+        first_partials.append(first_partial)
+    elapsed = min(timings)
+    first_partials = [value for value in first_partials if value is not None]
+    return {'elapsed': elapsed, 'rtf': elapsed / duration,
+            'first_partial': min(first_partials) if first_partials else None}
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(SAMPLES_DIR),
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load(model, decode, buffer_size):
+    from at16k.api import SpeechToText, LiveSpeechToText
+    start = time.perf_counter()
+    if model in LIVE_MODELS:
+        stt = LiveSpeechToText(model_name=model, buffer_size=buffer_size, faster=(decode == 'greedy'))
+    else:
+        stt = SpeechToText(model)
+    return stt, time.perf_counter() - start
+
+
+def run_case(model, decode, file_path, buffer_size=4096, repeat=3):
+    """
+    Load a model and benchmark it on one input; returns a result dict.
+    Meant to run in a process of its own, see run().
+    """
+    stt, load_time = _load(model, decode, buffer_size)
+    try:
+        duration = Media(file_path).duration
+        if model in LIVE_MODELS:
+            result = measure_live(stt, file_path, duration, repeat)
+        else:
+            result = measure_offline(stt, file_path, duration, repeat)
+    finally:
+        stt.close()
+    result.update({'model': model, 'decode': decode, 'input': os.path.basename(file_path),
+                   'duration': duration, 'load_time': load_time, 'peak_rss_mb': peak_rss_mb()})
+    return result
+
+
+def run(models, inputs, decodes=('greedy', 'beam'), buffer_size=4096, repeat=3):
+    """
+    Benchmark every model on the inputs with its sample rate, each case in a new process;
+    returns a list of result dicts
+    """
+    # Spawned rather than forked, so that nothing loaded by earlier cases is inherited.
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for model in models:
+        for decode in decodes if model in LIVE_MODELS else [None]:
+            for file_path in inputs:
+                if Media(file_path).sample_rate != SAMPLE_RATES[model]:
+                    continue
+                with context.Pool(1) as pool:
+                    result = pool.apply(run_case, (model, decode, file_path, buffer_size, repeat))
+                results.append(result)
+                print('%(model)s %(decode)s %(input)s: rtf %(rtf).3f' % result, flush=True)
+    return results
+
+
+def main():
+    """
+    Main
+    """
+    flags = PARSER.parse_args()
+    if not flags.inputs and not os.path.isdir(SAMPLES_DIR):
+        PARSER.error('the sample files are only in a source checkout, please give inputs with -i')
+    inputs = flags.inputs or [os.path.join(SAMPLES_DIR, name) for name in sorted(os.listdir(SAMPLES_DIR))
+                              if name.endswith('.wav')]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if flags.long_seconds > 0:
+            inputs = inputs + [synthesize_long(path, flags.long_seconds, tmp_dir) for path in inputs]
+        results = run(flags.models, inputs, flags.decode, flags.buffer_size, flags.repeat)
+    report = {
+        'version': at16k.__version__,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'buffer_size': flags.buffer_size,
+        'repeat': flags.repeat,
+        'results': results
+    }
+    with open(flags.out, 'w') as out_file:
+        json.dump(report, out_file, indent=2)
+    print('Results written to %s' % flags.out)
+
+
+if __name__ == '__main__':
+    main()
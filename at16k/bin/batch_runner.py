@@ -0,0 +1,161 @@
+"""
+Manifest-driven batch transcription with a pool of worker processes.
+Each worker loads its model once; results are appended to a JSON lines file
+which also serves as the record of completed entries when a job is resumed.
+"""
+import json
+import os
+from multiprocessing import Pool, Queue
+from at16k.core.threads import set_cpu_affinity, split_cpus
+
+LIVE_MODELS = ['en_16k_rnnt']
+
+_STT = None
+_MODEL = None
+
+
+def _init_worker(model, decode, live_options=None, threads=None, cpu_sets=None):
+    global _STT, _MODEL
+    from at16k.api import SpeechToText, LiveSpeechToText
+    if cpu_sets is not None:
+        # Each worker takes its own set, so workers never share a core.
+        set_cpu_affinity(cpu_sets.get())
+    if model in LIVE_MODELS:
+        faster = False if decode == 'beam' else True
+        _STT = LiveSpeechToText(model_name=model, faster=faster, threads=threads, **(live_options or {}))
+    else:
+        _STT = SpeechToText(model, threads=threads)
+    _MODEL = model
+
+
+def _transcribe_live(file_path):
+    text = None
+    finals = []
+    for result in _STT.from_file(file_path):
+        if result.get('final'):
+            finals.append(result['text'])
+        else:
+            text = result['text']
+    if not finals:
+        return {'file': file_path, 'text': text}
+    # With endpointing, the text of each utterance is kept, and joined for the whole file.
+    utterances = finals + [text] if text else finals
+    return {'file': file_path, 'text': ' '.join(utterances), 'utterances': utterances}
+
+
+def _transcribe_chunk(file_paths):
+    """
+    Transcribe a list of files in the worker process
+    """
+    if _MODEL in LIVE_MODELS:
+        items = []
+        for file_path in file_paths:
+            try:
+                items.append(_transcribe_live(file_path))
+            except Exception as error:  # pylint: disable=broad-except
+                items.append({'file': file_path, 'error': repr(error)})
+        return items
+    try:
+        return _STT.batch(file_paths, max_batch=len(file_paths))
+    except Exception:  # pylint: disable=broad-except
+        # Retry one by one so that a single bad file does not fail the whole chunk.
+        items = []
+        for file_path in file_paths:
+            try:
+                items.append(_STT(file_path))
+            except Exception as error:  # pylint: disable=broad-except
+                items.append({'file': file_path, 'error': repr(error)})
+        return items
+
+
+def read_manifest(manifest_path):
+    """
+    One file path per line; blank lines and lines starting with # are ignored
+    """
+    file_paths = []
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                file_paths.append(line)
+    return file_paths
+
+
+def read_completed(out_path):
+    """
+    Files already transcribed successfully in a previous run
+    """
+    completed = set()
+    if not os.path.exists(out_path):
+        return completed
+    with open(out_path, 'r') as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # Partial line left behind by a killed job.
+                continue
+            if 'error' not in item:
+                completed.add(item['file'])
+    return completed
+
+
+def _open_output(out_path):
+    needs_newline = False
+    if os.path.exists(out_path) and os.path.getsize(out_path) > 0:
+        with open(out_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    out_file = open(out_path, 'a', buffering=1024 * 1024)
+    if needs_newline:
+        out_file.write('\n')
+    return out_file
+
+
+def run(model, manifest_path, out_path, workers=1, chunk_size=16, decode='beam', live_options=None,
+        threads=None, cpus=None):
+    """
+    Transcribe every file listed in manifest_path that is not already in out_path.
+    live_options are extra LiveSpeechToText arguments, used with live models only.
+    threads is the ThreadConfig of every worker. cpus, a list of CPU ids, is split evenly
+    between the workers and each worker is pinned to its share.
+    Returns a (num_done, num_failed, num_skipped) tuple.
+    """
+    file_paths = read_manifest(manifest_path)
+    completed = read_completed(out_path)
+    pending = [file_path for file_path in file_paths if file_path not in completed]
+    chunks = [pending[start:(start + chunk_size)] for start in range(0, len(pending), chunk_size)]
+    num_done = 0
+    num_failed = 0
+    with _open_output(out_path) as out_file:
+        if workers > 1:
+            cpu_sets = None
+            if cpus:
+                cpu_sets = Queue()
+                for cpu_set in split_cpus(cpus, workers):
+                    cpu_sets.put(cpu_set)
+            pool = Pool(workers, initializer=_init_worker, initargs=(model, decode, live_options, threads, cpu_sets))
+            results = pool.imap_unordered(_transcribe_chunk, chunks)
+        else:
+            pool = None
+            if cpus:
+                set_cpu_affinity(cpus)
+            _init_worker(model, decode, live_options, threads)
+            results = (_transcribe_chunk(chunk) for chunk in chunks)
+        try:
+            for items in results:
+                for item in items:
+                    out_file.write(json.dumps(item) + '\n')
+                    if 'error' in item:
+                        num_failed += 1
+                    else:
+                        num_done += 1
+                out_file.flush()
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return num_done, num_failed, len(file_paths) - len(pending)
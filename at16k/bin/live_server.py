@@ -0,0 +1,61 @@
+"""
+Streaming speech-to-text server (command-line)
+"""
+import argparse
+import asyncio
+from at16k.api.live_server import LiveServer
+from at16k.bin.options import add_live_arguments, live_options
+from at16k.core.metrics import Metrics
+from at16k.core.threads import ThreadConfig, parse_cpus, set_cpu_affinity
+
+PARSER = argparse.ArgumentParser('at16k Speech-to-Text Server')
+PARSER.add_argument('-m', '--model', type=str, default='en_16k_rnnt', choices=['en_16k_rnnt'])
+PARSER.add_argument('-d', '--decode', type=str, choices=['beam', 'greedy'], default='greedy',
+                    help='Beam will be slower but more accurate.')
+add_live_arguments(PARSER, live_only=True)
+PARSER.add_argument('--host', type=str, default='127.0.0.1')
+PARSER.add_argument('--port', type=int, default=8000)
+PARSER.add_argument('--workers', type=int, default=4,
+                    help='Number of threads decoding audio; streams beyond this wait their turn.')
+PARSER.add_argument('--batch-streams', action='store_true',
+                    help='Decode chunks from concurrent streams together, one encoder run per step.')
+PARSER.add_argument('--intra-op-threads', type=int,
+                    help='TensorFlow threads used inside a single op. Defaults to one per core.')
+PARSER.add_argument('--inter-op-threads', type=int,
+                    help='TensorFlow threads running independent ops. Defaults to one per core.')
+PARSER.add_argument('--shared-inter-op-pool', action='store_true',
+                    help='Run all TensorFlow sessions of a process on one inter-op thread pool.')
+PARSER.add_argument('--cpus', type=str,
+                    help='CPU ids to run the server on, e.g. 0-7,16.')
+PARSER.add_argument('--metrics', action='store_true',
+                    help='Time every network run and serve the counters at /metrics (Prometheus text format).')
+
+
+def main():
+    """
+    Main
+    """
+    from at16k.api import LiveSpeechToText
+    flags = PARSER.parse_args()
+    if flags.cpus:
+        set_cpu_affinity(parse_cpus(flags.cpus))
+    faster = False if flags.decode == 'beam' else True
+    threads = ThreadConfig(flags.intra_op_threads, flags.inter_op_threads, flags.shared_inter_op_pool)
+    metrics = Metrics() if flags.metrics else None
+    stt = LiveSpeechToText(model_name=flags.model, faster=faster, batch_streams=flags.batch_streams,
+                           max_batch=flags.workers, threads=threads,
+                           metrics=metrics, **live_options(flags))
+    server = LiveServer(stt, max_workers=flags.workers, metrics=metrics)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start(flags.host, flags.port))
+    print('Listening on http://%s:%d/transcribe' % (flags.host, flags.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.close())
+
+
+if __name__ == '__main__':
+    main()
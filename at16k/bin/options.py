@@ -0,0 +1,43 @@
+"""
+Command-line options of the live models, shared by the speech-to-text command and the server
+"""
+from at16k.core.live_model import EndpointConfig
+
+
+def add_live_arguments(parser, live_only=False):
+    """
+    Add the options of the live models to parser. Unless the command only runs live models
+    (live_only), their help says that they do not apply to the others.
+    """
+
+    def _help(text):
+        return text[0].upper() + text[1:] if live_only else 'Live models only: ' + text
+
+    parser.add_argument('--batched-beam', action='store_true',
+                        help='Beam decoding only: run the text encoder and joint network on several hypotheses '
+                             'at a time.')
+    parser.add_argument('--backend', type=str, choices=['tf', 'numpy'], default='tf',
+                        help=_help('run the text encoder and joint network with numpy instead of TensorFlow.'))
+    parser.add_argument('--fused-graph', action='store_true',
+                        help=_help('load the five networks into a single TensorFlow graph and session.'))
+    parser.add_argument('--endpoint-windows', type=int,
+                        help=_help('end an utterance after this many encoder windows without new symbols.'))
+    parser.add_argument('--endpoint-silence', type=float,
+                        help=_help('end an utterance after this many seconds of low-energy audio.'))
+
+
+def live_options(args):
+    """
+    Keyword arguments of LiveSpeechToText from the parsed options
+    """
+    return {'batched_beam': args.batched_beam, 'backend': args.backend, 'fused': args.fused_graph,
+            'endpoint': endpoint_config(args)}
+
+
+def endpoint_config(args):
+    """
+    EndpointConfig from the parsed options, None if endpointing is off
+    """
+    if args.endpoint_windows is None and args.endpoint_silence is None:
+        return None
+    return EndpointConfig(blank_windows=args.endpoint_windows, silence=args.endpoint_silence)
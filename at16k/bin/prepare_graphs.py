@@ -0,0 +1,29 @@
+"""
+Prepare optional graphs of a model (command-line)
+    offline models: the waveform graph (see at16k.core.model.prepare_waveform_graph), which feeds
+        waveforms directly instead of serialized tf.train.Example protos
+    live models: the fused graph (see at16k.core.live_inference.prepare_fused_graph), used with --fused-graph
+"""
+import argparse
+from at16k.core.model import Model, prepare_waveform_graph
+
+PARSER = argparse.ArgumentParser('at16k Graph Preparation')
+PARSER.add_argument('-m', '--model', type=str, required=True, choices=['en_8k', 'en_16k', 'en_16k_rnnt'])
+
+
+def main():
+    """
+    Main
+    """
+    flags = PARSER.parse_args()
+    model_dir = Model._get_model_dir(flags.model)  # pylint: disable=protected-access
+    if flags.model in ['en_16k_rnnt']:
+        from at16k.core.live_inference import prepare_fused_graph
+        graph_path = prepare_fused_graph(model_dir)
+    else:
+        graph_path = prepare_waveform_graph(model_dir)
+    print('Graph written to %s' % graph_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,60 +2,165 @@
 Speech to text converter (command-line)
 """
 import argparse
-from at16k.api import SpeechToText, LiveSpeechToText
+import sys
+import numpy as np
+from at16k import api
+from at16k.bin.options import add_live_arguments, live_options
+from at16k.core.media import RAW_FORMATS, iter_raw_chunks
+from at16k.core.threads import ThreadConfig, parse_cpus, set_cpu_affinity
 
 PARSER = argparse.ArgumentParser('at16k Speech-to-Text')
 PARSER.add_argument('-m', '--model', type=str,
                     required=True, choices=['en_8k', 'en_16k', 'en_16k_rnnt'])
 PARSER.add_argument('-i', '--input', type=str,
                     help='Input WAV file. Optional, if using en_16k_rnnt model, else mandatory.')
+PARSER.add_argument('--stdin', action='store_true',
+                    help='Read raw mono PCM (see --raw-format) from standard input instead of a WAV file.')
+PARSER.add_argument('--raw-input', type=str,
+                    help='Read raw mono PCM (see --raw-format) from this file or named pipe (FIFO).')
+PARSER.add_argument('--raw-format', type=str, choices=sorted(RAW_FORMATS), default='s16le',
+                    help='Raw input sample format: signed 16-bit or 32-bit float, little-endian.')
+PARSER.add_argument('--raw-rate', type=int,
+                    help="Raw input sample rate, resampled to the model's. Defaults to the model's.")
+PARSER.add_argument('--raw-chunk-size', type=int, default=4096,
+                    help='Samples per read of raw input.')
 PARSER.add_argument('-d', '--decode', type=str, choices=['beam', 'greedy'], default='beam',
                     help='Applies only when using en_16k_rnnt model. Beam will be slower but more accurate.')
+add_live_arguments(PARSER, live_only=False)
+PARSER.add_argument('--manifest', type=str,
+                    help='Text file with one input WAV file per line. Enables batch mode.')
+PARSER.add_argument('--out', type=str, default='results.jsonl',
+                    help='Batch mode: JSON lines output file. Files already in it are skipped, so a killed job resumes.')
+PARSER.add_argument('--workers', type=int, default=1,
+                    help='Batch mode: number of worker processes, each loads the model once.')
+PARSER.add_argument('--max-batch', type=int, default=16,
+                    help='Batch mode: number of files sent to a worker (and to the offline model) at a time.')
+PARSER.add_argument('--intra-op-threads', type=int,
+                    help='TensorFlow threads used inside a single op. Defaults to one per core.')
+PARSER.add_argument('--inter-op-threads', type=int,
+                    help='TensorFlow threads running independent ops. Defaults to one per core.')
+PARSER.add_argument('--shared-inter-op-pool', action='store_true',
+                    help='Run all TensorFlow sessions of a process on one inter-op thread pool.')
+PARSER.add_argument('--cpus', type=str,
+                    help='CPU ids to run on, e.g. 0-7,16. In batch mode they are split evenly between the workers.')
 FLAGS = PARSER.parse_args()
 
 
+def _thread_config(args):
+    return ThreadConfig(args.intra_op_threads, args.inter_op_threads, args.shared_inter_op_pool)
+
+
 def convert_live_from_file(model, args):
     text = None
     faster = False if args.decode == 'beam' else True
-    stt = LiveSpeechToText(model_name=model, faster=faster)
+    stt = api.LiveSpeechToText(model_name=model, faster=faster, threads=_thread_config(args),
+                               **live_options(args))
     for result in stt.from_file(args.input):
         text = result['text']
-        print('Intermediate results:', text, end="\r", flush=True)
+        if result.get('final'):
+            print('Final:', text, flush=True)
+        else:
+            print('Intermediate results:', text, end="\r", flush=True)
     return text
 
 
 def convert_live_from_microphone(model, args):
     from at16k.core.microphone import MicrophoneStream
     faster = False if args.decode == 'beam' else True
-    stt = LiveSpeechToText(model_name=model, faster=faster)
+    stt = api.LiveSpeechToText(model_name=model, faster=faster, threads=_thread_config(args),
+                               **live_options(args))
     text = None
     context = None
     with MicrophoneStream() as stream:
         for chunk in stream.generator():
             if chunk:
                 text, context = stt.from_buffer(chunk, context, dtype='<i2')
+                for final in context['finals']:
+                    print('Final:', final, flush=True)
+                del context['finals'][:]
                 print('Intermediate results:', text, end="\r", flush=True)
     return text
 
 
+def _open_raw_input(args):
+    if args.stdin:
+        return sys.stdin.buffer
+    return open(args.raw_input, 'rb')
+
+
+def convert_live_from_raw(model, args):
+    faster = False if args.decode == 'beam' else True
+    stt = api.LiveSpeechToText(model_name=model, faster=faster, threads=_thread_config(args),
+                               **live_options(args))
+    dtype = RAW_FORMATS[args.raw_format]
+    text = None
+    context = None
+    with _open_raw_input(args) as stream:
+        for chunk in iter_raw_chunks(stream, args.raw_chunk_size, dtype):
+            text, context = stt.from_buffer(chunk, context, dtype=dtype, sample_rate=args.raw_rate)
+            for final in context['finals']:
+                print('Final:', final, flush=True)
+            del context['finals'][:]
+            print('Intermediate results:', text, end="\r", flush=True)
+    return text
+
+
+def convert_offline_from_raw(model, args):
+    stt = api.SpeechToText(model, threads=_thread_config(args))
+    dtype = RAW_FORMATS[args.raw_format]
+    with _open_raw_input(args) as stream:
+        chunks = [np.frombuffer(chunk, dtype=dtype)
+                  for chunk in iter_raw_chunks(stream, args.raw_chunk_size, dtype)]
+    assert chunks, 'No audio read from the raw input'
+    waveform = np.concatenate(chunks)
+    if waveform.dtype.kind == 'f':
+        # Offline models take the sample values of 16-bit PCM.
+        waveform = np.round(np.clip(waveform, -1., 1.) * np.iinfo(np.int16).max).astype(np.int16)
+    result = stt.from_waveform(waveform, sample_rate=args.raw_rate)
+    return result['text']
+
+
 def convert_offline_from_file(model, args):
     assert args.input, 'Please specify input file (-i). See help for more details'
-    stt = SpeechToText(model)
+    stt = api.SpeechToText(model, threads=_thread_config(args))
     result = stt(args.input)
     text = result['text']
     return text
 
 
+def convert_batch_from_manifest(model, args):
+    from at16k.bin import batch_runner
+    num_done, num_failed, num_skipped = batch_runner.run(model, args.manifest, args.out,
+                                                         workers=args.workers,
+                                                         chunk_size=args.max_batch,
+                                                         decode=args.decode,
+                                                         live_options=live_options(args),
+                                                         threads=_thread_config(args),
+                                                         cpus=parse_cpus(args.cpus) if args.cpus else None)
+    print('Transcribed: %d, failed: %d, skipped (already done): %d' % (num_done, num_failed, num_skipped))
+    print('Results written to %s' % args.out)
+
+
 def main():
     """
     Main
     """
     model = FLAGS.model
+    if FLAGS.manifest:
+        convert_batch_from_manifest(model, FLAGS)
+        return
+    if FLAGS.cpus:
+        set_cpu_affinity(parse_cpus(FLAGS.cpus))
+    raw_input = FLAGS.stdin or FLAGS.raw_input
     if model in ['en_16k_rnnt']:
-        if FLAGS.input:
+        if raw_input:
+            text = convert_live_from_raw(model, FLAGS)
+        elif FLAGS.input:
             text = convert_live_from_file(model, FLAGS)
         else:
             text = convert_live_from_microphone(model, FLAGS)
+    elif raw_input:
+        text = convert_offline_from_raw(model, FLAGS)
     else:
         text = convert_offline_from_file(model, FLAGS)
     print('-' * 100)
@@ -0,0 +1,70 @@
+"""
+Segmenter
+"""
+
+import numpy as np
+from at16k.core.segment import Segment
+
+
+class Segmenter():
+    """
+    Split a long waveform into segments no longer than max_duration.
+    Cuts are placed at the lowest-energy point available in each search window.
+    """
+
+    def __init__(self, max_duration, min_duration=None, frame_duration=0.02):
+        assert max_duration > 0, 'max_duration must be positive'
+        if min_duration is None:
+            min_duration = max_duration / 2.
+        assert 0 < min_duration <= max_duration, 'min_duration must be in (0, max_duration]'
+        self._max_duration = max_duration
+        self._min_duration = min_duration
+        self._frame_duration = frame_duration
+
+    @staticmethod
+    def _frame_energies(waveform, frame_length):
+        """
+        Mean energy of consecutive non-overlapping frames
+        """
+        num_frames = len(waveform) // frame_length
+        frames = np.reshape(waveform[:num_frames * frame_length], (num_frames, frame_length))
+        frames = frames.astype(np.float64)
+        return np.mean(frames * frames, axis=1)
+
+    def _find_cuts(self, num_samples, sample_rate, energies, frame_length):
+        """
+        Sample offsets at which the waveform is split
+        """
+        max_samples = int(self._max_duration * sample_rate)
+        min_samples = int(self._min_duration * sample_rate)
+        # Energy around each frame boundary: frame before + frame after.
+        boundary_energies = energies[:-1] + energies[1:]
+        cuts = []
+        begin = 0
+        while num_samples - begin > max_samples:
+            first = -(-(begin + min_samples) // frame_length)
+            last = (begin + max_samples) // frame_length
+            first = max(first, 1)
+            last = min(last, len(boundary_energies))
+            if first > last:
+                cut = begin + max_samples
+            else:
+                cut = (first + int(np.argmin(boundary_energies[(first - 1):last]))) * frame_length
+            cuts.append(cut)
+            begin = cut
+        return cuts
+
+    def __call__(self, waveform, sample_rate, channel=0):
+        num_samples = len(waveform)
+        frame_length = max(int(self._frame_duration * sample_rate), 1)
+        energies = self._frame_energies(waveform, frame_length)
+        cuts = self._find_cuts(num_samples, sample_rate, energies, frame_length)
+        offsets = [0] + cuts + [num_samples]
+        segments = []
+        for begin, end in zip(offsets[:-1], offsets[1:]):
+            segment = Segment(waveform=waveform[begin:end],
+                              boundaries=(begin / float(sample_rate), end / float(sample_rate)),
+                              sample_rate=sample_rate,
+                              channel=channel)
+            segments.append(segment)
+        return segments
@@ -2,9 +2,14 @@
 Transcriber
 """
 
-import tensorflow as tf
+import logging
 from at16k.core.segment import Segment
 from at16k.core.model import Model
+from at16k.utils.lazy_import import LazyModule
+
+tf = LazyModule('tensorflow')
+
+LOGGER = logging.getLogger(__name__)
 
 
 class Transcriber():
@@ -28,18 +33,51 @@ class Transcriber():
         return example.SerializeToString()
 
     @staticmethod
-    def _decode_example(example, model):
-        pred_fn = model.pred_fn
-        output_fn = model.output_fn
-        predictions = pred_fn({'input': [example]})
-        output = list(predictions['outputs'])[0]
-        score = list(predictions['scores'])[0]
-        text = output_fn(output, strip_extraneous=True)
-        return text, float(score)
+    def _predict(waveforms, model):
+        # The model is shared, so a batch the waveform graph rejects only falls back for this call.
+        if model.waveform_fn is not None:
+            try:
+                return model.waveform_fn(waveforms)
+            except ValueError as error:
+                # Feeds rejected before running, e.g. "Cannot feed value of shape".
+                LOGGER.warning('Direct waveform input failed, using tf.train.Example input: %s', error)
+            except tf.errors.InvalidArgumentError as error:
+                # Shape errors raised while running the graph.
+                LOGGER.warning('Direct waveform input failed, using tf.train.Example input: %s', error)
+        examples = [Transcriber._make_example(waveform) for waveform in waveforms]
+        return model.pred_fn({'input': examples})
+
+    @staticmethod
+    def _decode_waveforms(waveforms, model):
+        output_batch_fn = model.output_batch_fn
+        predictions = Transcriber._predict(waveforms, model)
+        texts = output_batch_fn(list(predictions['outputs']), strip_extraneous=True)
+        scores = list(predictions['scores'])
+        return [(text, float(score)) for text, score in zip(texts, scores)]
+
+    @staticmethod
+    def _make_buckets(segments, max_batch):
+        """
+        Group segment indices by duration so that each batch pads as little as possible
+        """
+        order = sorted(range(len(segments)), key=lambda idx: len(segments[idx].waveform))
+        return [order[start:(start + max_batch)] for start in range(0, len(order), max_batch)]
 
     def __call__(self, segment: Segment):
         model = self._model
-        waveform = segment.waveform
-        example = self._make_example(waveform)
-        text, score = self._decode_example(example, model)
+        text, score = self._decode_waveforms([segment.waveform], model)[0]
         return text, score
+
+    def batch(self, segments, max_batch=16):
+        """
+        Transcribe a list of segments, max_batch segments of similar duration per prediction call.
+        Returns a list of (text, score) tuples in the same order as segments.
+        """
+        assert max_batch > 0, 'max_batch must be a positive integer'
+        model = self._model
+        results = [None] * len(segments)
+        for bucket in self._make_buckets(segments, max_batch):
+            waveforms = [segments[idx].waveform for idx in bucket]
+            for idx, result in zip(bucket, self._decode_waveforms(waveforms, model)):
+                results[idx] = result
+        return results
@@ -0,0 +1,70 @@
+"""
+Binary format of serialized live decoding contexts
+
+    magic (8 bytes) | version (uint16) | header length (uint32) | JSON header | array data
+
+The JSON header holds the plain values of the context and, for every array, its name, stored
+dtype and shape. Array data follows in header order, little-endian and without padding.
+Floating point arrays are stored as float32, or float16 if requested, and loaded as float32.
+"""
+
+import json
+import struct
+import numpy as np
+
+MAGIC = b'AT16KCTX'
+VERSION = 1
+_PREFIX = struct.Struct('<8sHI')
+
+
+def _to_json(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('%s is not serializable' % type(value).__name__)
+
+
+def dumps(values, arrays, float16=False):
+    """
+    Serialize a dict of JSON-compatible values and a dict of numpy arrays
+    """
+    float_dtype = np.dtype('<f2') if float16 else np.dtype('<f4')
+    specs = []
+    chunks = []
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if array.dtype.kind == 'f':
+            array = array.astype(float_dtype)
+        else:
+            array = array.astype(array.dtype.newbyteorder('<'))
+        specs.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape)})
+        chunks.append(np.ascontiguousarray(array).tobytes())
+    try:
+        header = json.dumps({'values': values, 'arrays': specs}, default=_to_json).encode('utf-8')
+    except TypeError as error:
+        raise ValueError('Cannot serialize context: %s' % error)
+    return b''.join([_PREFIX.pack(MAGIC, VERSION, len(header)), header] + chunks)
+
+
+def loads(data):
+    """
+    Parse bytes written by dumps(). Returns the values dict and the arrays dict.
+    """
+    if len(data) < _PREFIX.size:
+        raise ValueError('Truncated context')
+    magic, version, header_size = _PREFIX.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('Not a serialized live context')
+    if version > VERSION:
+        raise ValueError('Unsupported context version %d (latest is %d)' % (version, VERSION))
+    offset = _PREFIX.size + header_size
+    header = json.loads(bytes(data[_PREFIX.size:offset]).decode('utf-8'))
+    arrays = {}
+    for spec in header['arrays']:
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        if offset + count * dtype.itemsize > len(data):
+            raise ValueError('Truncated context')
+        array = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(spec['shape'])
+        offset += count * dtype.itemsize
+        arrays[spec['name']] = array.astype(np.float32) if dtype.kind == 'f' else array.astype(dtype.newbyteorder('='))
+    return header['values'], arrays
@@ -1,109 +1,220 @@
+import collections
+import functools
+import logging
 import os
+import time
 import numpy as np
-import tensorflow as tf
+from at16k.core.numpy_backend import NumpyGraph, NumpyTextEncoder, UnsupportedGraph
+from at16k.core.threads import session_config
+from at16k.utils.lazy_import import LazyModule
+
+tf = LazyModule('tensorflow')
+
+LOGGER = logging.getLogger(__name__)
+
+BACKENDS = ('tf', 'numpy')
+
+# Frozen graph file and tensor names of each network, keyed as in LiveInferrer._sessions.
+GRAPHS = collections.OrderedDict([
+    ('f', ('audio_features.graph.pb', {'inputs': 'samples:0', 'outputs': 'feats:0'})),
+    ('d', ('delta_features.graph.pb', {'inputs': 'raw_feats:0', 'outputs': 'delta_feats:0'})),
+    ('a', ('audio_encoder.graph.pb', {
+        'inputs': 'audio_encoder/a_inputs:0',
+        'inputs_states': 'audio_encoder/a_inputs_states:0',
+        'outputs': 'audio_encoder/a_outputs:0',
+        'outputs_states': 'audio_encoder/a_states:0'})),
+    ('t', ('text_encoder.graph.pb', {
+        'inputs': 'text_encoder/t_inputs:0',
+        'inputs_lengths': 'text_encoder/t_inputs_lengths:0',
+        'inputs_states': 'text_encoder/t_inputs_states:0',
+        'outputs': 'text_encoder/t_outputs:0',
+        'outputs_states': 'text_encoder/t_states:0'})),
+    ('j', ('joint_encoder.graph.pb', {
+        'a_inputs': 'rnnt_logits/a_logits:0',
+        't_inputs': 'rnnt_logits/t_logits:0',
+        'logits': 'joint_logits:0',
+        'probs': 'joint_log_probs:0'})),
+])
+
+
+def _timed(key):
+    """
+    Record the duration of each call of a LiveInferrer method as a run of network key, if the
+    inferrer has metrics
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._metrics is None:
+                return method(self, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self._metrics.observe_latency(key, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# Optional output of prepare_fused_graph(), next to the five frozen graphs.
+FUSED_GRAPH = 'live.graph.pb'
+
+
+def _read_graph_def(graph_path):
+    with tf.gfile.GFile(graph_path, "rb") as f:
+        graph_def = tf.GraphDef()
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def fuse_graphs(model_dir):
+    """
+    Import the five frozen graphs of a live model into one GraphDef, each under the scope of its key.
+    The features output is appended to an optional fused/feats_history input (fused/feats) and fed
+    to the delta network, so that features and delta features are computed in one run.
+    """
+    with tf.Graph().as_default() as graph:
+        for key, (graph_file, _) in GRAPHS.items():
+            graph_def = _read_graph_def(os.path.join(model_dir, graph_file))
+            if key != 'd':
+                tf.import_graph_def(graph_def, name=key)
+                continue
+            feats = graph.get_tensor_by_name('f/feats:0')
+            with tf.name_scope('fused'):
+                history = tf.placeholder_with_default(feats[:, :0], shape=None, name='feats_history')
+                feats = tf.concat([history, feats], axis=1, name='feats')
+            tf.import_graph_def(graph_def, input_map={'raw_feats:0': feats}, name=key)
+    return graph.as_graph_def()
+
+
+def prepare_fused_graph(model_dir):
+    """
+    Write the fused graph of a live model (see fuse_graphs) to model_dir, so that fused
+    LiveInferrers load it directly. Returns its path.
+    """
+    graph_path = os.path.join(model_dir, FUSED_GRAPH)
+    with tf.gfile.GFile(graph_path, "wb") as f:
+        f.write(fuse_graphs(model_dir).SerializeToString())
+    return graph_path
 
 
 class LiveInferrer:
-    def __init__(self, params, model_dir):
+    """
+    Runs the five frozen graphs of a live model: features (f), delta features (d), audio encoder (a),
+    text encoder (t) and joint network (j).
+    With backend='numpy', the text encoder and the joint network run as numpy code instead of
+    TensorFlow sessions. Each numpy network is compared with its TensorFlow session on its first
+    call and replaced by the session if the outputs differ or the graph cannot be converted.
+    With fused=True, the five networks share one graph and one session (see fuse_graphs), and
+    infer_feature_deltas() runs the features and delta features in a single call.
+    threads is an at16k.core.threads.ThreadConfig applied to every session.
+    With metrics (an at16k.core.metrics.Metrics), the duration of every network run is recorded
+    under its key; fused features and delta features runs are recorded as fd.
+    """
+
+    def __init__(self, params, model_dir, backend='tf', fused=False, threads=None, metrics=None):
+        assert backend in BACKENDS, 'Unknown backend %s' % backend
         self._params = params
-        self._sessions, self._nodes = self._make_sessions(model_dir)
+        self._metrics = metrics
+        self._fused = fused
+        self._config = session_config(threads)
+        if fused:
+            self._sessions, self._nodes = self._make_fused_session(model_dir)
+        else:
+            self._sessions, self._nodes = self._make_sessions(model_dir)
         self._model_dir = model_dir
+        self._numpy = self._make_numpy_networks(model_dir) if backend == 'numpy' else {}
+        self._verified = set()
 
     @staticmethod
     def _load_graph(frozen_graph_filename):
-        with tf.gfile.GFile(frozen_graph_filename, "rb") as f:
-            graph_def = tf.GraphDef()
-            graph_def.ParseFromString(f.read())
-
         with tf.Graph().as_default() as graph:
-            tf.import_graph_def(graph_def, name="prefix")
+            tf.import_graph_def(_read_graph_def(frozen_graph_filename), name="prefix")
         return graph
 
-    def _make_audio_features_session(self, graph_path):
-        _nodes = {}
-        _graph = self._load_graph(graph_path)
-        _nodes['inputs'] = _graph.get_tensor_by_name('prefix/samples:0')
-        _nodes['outputs'] = _graph.get_tensor_by_name('prefix/feats:0')
-        _session = tf.Session(graph=_graph)
-        return _session, _nodes
-
-    def _make_delta_features_session(self, graph_path):
-        _nodes = {}
-        _graph = self._load_graph(graph_path)
-        _nodes['inputs'] = _graph.get_tensor_by_name('prefix/raw_feats:0')
-        _nodes['outputs'] = _graph.get_tensor_by_name('prefix/delta_feats:0')
-        _session = tf.Session(graph=_graph)
-        return _session, _nodes
+    @staticmethod
+    def _get_nodes(graph, scope, key):
+        return {name: graph.get_tensor_by_name('%s/%s' % (scope, tensor))
+                for name, tensor in GRAPHS[key][1].items()}
 
-    def _make_audio_encoder_session(self, graph_path):
-        _nodes = {}
-        _graph = self._load_graph(graph_path)
-        _nodes['inputs'] = _graph.get_tensor_by_name(
-            'prefix/audio_encoder/a_inputs:0')
-        _nodes['inputs_states'] = _graph.get_tensor_by_name(
-            'prefix/audio_encoder/a_inputs_states:0')
-        _nodes['outputs'] = _graph.get_tensor_by_name(
-            'prefix/audio_encoder/a_outputs:0')
-        _nodes['outputs_states'] = _graph.get_tensor_by_name(
-            'prefix/audio_encoder/a_states:0')
-        _session = tf.Session(graph=_graph)
-        return _session, _nodes
-
-    def _make_text_encoder_session(self, graph_path):
-        _nodes = {}
-        _graph = self._load_graph(graph_path)
-        _nodes['inputs'] = _graph.get_tensor_by_name(
-            'prefix/text_encoder/t_inputs:0')
-        _nodes['inputs_lengths'] = _graph.get_tensor_by_name(
-            'prefix/text_encoder/t_inputs_lengths:0')
-        _nodes['inputs_states'] = _graph.get_tensor_by_name(
-            'prefix/text_encoder/t_inputs_states:0')
-        _nodes['outputs'] = _graph.get_tensor_by_name(
-            'prefix/text_encoder/t_outputs:0')
-        _nodes['outputs_states'] = _graph.get_tensor_by_name(
-            'prefix/text_encoder/t_states:0')
-        _session = tf.Session(graph=_graph)
-        return _session, _nodes
-
-    def _make_joint_encoder_session(self, graph_path):
+    def _make_sessions(self, model_dir):
+        _sessions = {}
         _nodes = {}
-        _graph = self._load_graph(graph_path)
-        _nodes['a_inputs'] = _graph.get_tensor_by_name(
-            'prefix/rnnt_logits/a_logits:0')
-        _nodes['t_inputs'] = _graph.get_tensor_by_name(
-            'prefix/rnnt_logits/t_logits:0')
-        _nodes['logits'] = _graph.get_tensor_by_name('prefix/joint_logits:0')
-        _nodes['probs'] = _graph.get_tensor_by_name('prefix/joint_log_probs:0')
-        _session = tf.Session(graph=_graph)
-        return _session, _nodes
+        for key, (graph_file, _) in GRAPHS.items():
+            _graph = self._load_graph(os.path.join(model_dir, graph_file))
+            _nodes[key] = self._get_nodes(_graph, 'prefix', key)
+            _sessions[key] = tf.Session(graph=_graph, config=self._config)
+        return _sessions, _nodes
 
-    def _make_sessions(self, model_dir):
-        _f_session, _f_nodes = self._make_audio_features_session(
-            os.path.join(model_dir, 'audio_features.graph.pb'))
-        _d_session, _d_nodes = self._make_delta_features_session(
-            os.path.join(model_dir, 'delta_features.graph.pb'))
-        _a_session, _a_nodes = self._make_audio_encoder_session(
-            os.path.join(model_dir, 'audio_encoder.graph.pb'))
-        _t_session, _t_nodes = self._make_text_encoder_session(
-            os.path.join(model_dir, 'text_encoder.graph.pb'))
-        _j_session, _j_nodes = self._make_joint_encoder_session(
-            os.path.join(model_dir, 'joint_encoder.graph.pb'))
-        _sessions = {
-            'f': _f_session,
-            'd': _d_session,
-            'a': _a_session,
-            't': _t_session,
-            'j': _j_session
-        }
-        _nodes = {
-            'f': _f_nodes,
-            'd': _d_nodes,
-            'a': _a_nodes,
-            't': _t_nodes,
-            'j': _j_nodes
+    def _make_fused_session(self, model_dir):
+        """
+        Load the five networks into one graph and one session, see fuse_graphs()
+        """
+        _fused_path = os.path.join(model_dir, FUSED_GRAPH)
+        if os.path.exists(_fused_path):
+            _graph_def = _read_graph_def(_fused_path)
+        else:
+            _graph_def = fuse_graphs(model_dir)
+        with tf.Graph().as_default() as _graph:
+            tf.import_graph_def(_graph_def, name="prefix")
+        _session = tf.Session(graph=_graph, config=self._config)
+        _sessions = {key: _session for key in GRAPHS}
+        _nodes = {key: self._get_nodes(_graph, 'prefix/' + key, key) for key in GRAPHS}
+        # The delta network reads the concatenated features instead of its own placeholder.
+        _nodes['d']['inputs'] = _graph.get_tensor_by_name('prefix/fused/feats:0')
+        _nodes['fd'] = {
+            'inputs': _nodes['f']['inputs'],
+            'history': _graph.get_tensor_by_name('prefix/fused/feats_history:0'),
+            'feats': _nodes['d']['inputs'],
+            'outputs': _nodes['d']['outputs']
         }
         return _sessions, _nodes
 
+    def _make_numpy_networks(self, model_dir):
+        _networks = {}
+        try:
+            _graph_def = self._load_graph(os.path.join(model_dir, 'text_encoder.graph.pb')).as_graph_def()
+            _networks['t'] = NumpyTextEncoder.from_graph_def(
+                _graph_def, self._params, forget_bias=self._params.get('text_encoder_forget_bias', 1.0))
+        except UnsupportedGraph as error:
+            LOGGER.warning('Text encoder stays on TensorFlow: %s', error)
+        try:
+            _graph_def = self._load_graph(os.path.join(model_dir, 'joint_encoder.graph.pb')).as_graph_def()
+            _networks['j'] = NumpyGraph(
+                _graph_def, inputs=['prefix/rnnt_logits/a_logits:0', 'prefix/rnnt_logits/t_logits:0'],
+                outputs=['prefix/joint_logits:0', 'prefix/joint_log_probs:0'])
+        except UnsupportedGraph as error:
+            LOGGER.warning('Joint network stays on TensorFlow: %s', error)
+        return _networks
+
+    def _run_numpy(self, key, tf_fn, *args):
+        """
+        Run the numpy version of a network, checking it against TensorFlow on the first call
+        """
+        _network = self._numpy.get(key)
+        if _network is None:
+            return tf_fn(*args)
+        try:
+            outputs = _network(*args)
+        except Exception as error:  # pylint: disable=broad-except
+            LOGGER.warning('Numpy %s network failed, using TensorFlow: %s', key, error)
+            self._numpy.pop(key, None)
+            return tf_fn(*args)
+        if key not in self._verified:
+            expected = tf_fn(*args)
+            if not all(np.shape(a) == np.shape(b) and np.allclose(a, b, rtol=1e-3, atol=1e-4)
+                       for a, b in zip(outputs, expected)):
+                LOGGER.warning('Numpy %s network does not match TensorFlow, using TensorFlow', key)
+                self._numpy.pop(key, None)
+                return expected
+            self._verified.add(key)
+        return tuple(outputs)
+
+    def close(self):
+        for _session in set(self._sessions.values()):
+            _session.close()
+
+    @_timed('f')
     def infer_features(self, inputs):
         _session = self._sessions['f']
         _nodes = self._nodes['f']
@@ -112,6 +223,7 @@ class LiveInferrer:
         })
         return outputs
 
+    @_timed('d')
     def infer_delta_features(self, inputs):
         _session = self._sessions['d']
         _nodes = self._nodes['d']
@@ -120,24 +232,55 @@ class LiveInferrer:
         })
         return outputs
 
+    def infer_feature_deltas(self, inputs, feats_history=None):
+        """
+        Compute the features of a chunk of samples, append them to feats_history and compute the
+        delta features of the result. Returns (feats, delta_feats).
+        A single session run with a fused graph, two otherwise.
+        """
+        if not self._fused:
+            feats = self.infer_features(inputs)
+            if feats_history is not None:
+                feats = np.concatenate([feats_history, feats], axis=1)
+            return feats, self.infer_delta_features(feats)
+        return self._fused_feature_deltas(inputs, feats_history)
+
+    @_timed('fd')
+    def _fused_feature_deltas(self, inputs, feats_history):
+        _session = self._sessions['d']
+        _nodes = self._nodes['fd']
+        feed_dict = {_nodes['inputs']: inputs}
+        if feats_history is not None:
+            feed_dict[_nodes['history']] = feats_history
+        feats, delta_feats = _session.run([_nodes['feats'], _nodes['outputs']], feed_dict=feed_dict)
+        return feats, delta_feats
+
+    @_timed('a')
     def infer_audio_encoder(self, inputs, inputs_states=None):
         _session = self._sessions['a']
         _nodes = self._nodes['a']
         _params = self._params
         if inputs_states is None:
-            inputs_states = np.zeros((_params['audio_encoder_layers'], 2, 1, _params['audio_encoder_units']))
+            inputs_states = np.zeros((_params['audio_encoder_layers'], 2, len(inputs), _params['audio_encoder_units']))
         outputs, outputs_states = _session.run([_nodes['outputs'], _nodes['outputs_states']], feed_dict={
             _nodes['inputs']: inputs,
             _nodes['inputs_states']: inputs_states
         })
         return outputs, outputs_states
 
+    @_timed('t')
     def infer_text_encoder(self, inputs, inputs_lengths, inputs_states=None):
+        if inputs_states is None:
+            _params = self._params
+            inputs_states = np.zeros((_params['text_encoder_layers'], 2, len(inputs), _params['text_encoder_units']))
+        return self._run_numpy('t', self._tf_text_encoder, inputs, inputs_lengths, inputs_states)
+
+    def _tf_text_encoder(self, inputs, inputs_lengths, inputs_states=None):
         _session = self._sessions['t']
         _nodes = self._nodes['t']
         _params = self._params
         if inputs_states is None:
-            inputs_states = np.zeros((_params['text_encoder_layers'], 2, 1, _params['text_encoder_units']))
+            inputs_states = np.zeros((_params['text_encoder_layers'], 2, len(inputs), _params['text_encoder_units']))
         outputs, outputs_states = _session.run([_nodes['outputs'], _nodes['outputs_states']], feed_dict={
             _nodes['inputs']: inputs,
             _nodes['inputs_lengths']: inputs_lengths,
@@ -145,7 +288,11 @@ class LiveInferrer:
         })
         return outputs, outputs_states
 
+    @_timed('j')
     def infer_joint_encoder(self, a_inputs, t_inputs):
+        return self._run_numpy('j', self._tf_joint_encoder, a_inputs, t_inputs)
+
+    def _tf_joint_encoder(self, a_inputs, t_inputs):
         _session = self._sessions['j']
         _nodes = self._nodes['j']
         logits, probs = _session.run([_nodes['logits'], _nodes['probs']], feed_dict={
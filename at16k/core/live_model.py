@@ -2,50 +2,223 @@
 Load models for ASR
 """
 
+import collections
+import heapq
+import itertools
 import time
 import json
 import os
 from pathlib import Path
 import numpy as np
 import sentencepiece as spm
+from at16k.core import live_context
 from at16k.core.live_inference import LiveInferrer
 
 
+class Prefix:
+    """
+    Immutable token history, stored as a linked list from the last token back to the first.
+    Extending a prefix shares the whole history with its parent.
+    """
+    __slots__ = ('token', 'parent', 'length', '_hash')
+
+    def __init__(self, token, parent=None):
+        self.token = token
+        self.parent = parent
+        self.length = 1 if parent is None else parent.length + 1
+        self._hash = hash((token, None if parent is None else parent._hash))
+
+    def __len__(self):
+        return self.length
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, Prefix) or self.length != other.length or self._hash != other._hash:
+            return False
+        # Walk back until the two histories meet at a shared node.
+        node, other = self, other
+        while node is not other:
+            if node.token != other.token:
+                return False
+            node, other = node.parent, other.parent
+        return True
+
+    def extend(self, token):
+        return Prefix(token, self)
+
+    def tokens(self):
+        """
+        Return the token history as a list, oldest first
+        """
+        tokens = []
+        node = self
+        while node is not None:
+            tokens.append(node.token)
+            node = node.parent
+        tokens.reverse()
+        return tokens
+
+
 class BeamCandidate:
     """
     Single Beam Candidate
     """
+    __slots__ = ('prefix', 'text_state', 'log_prob')
 
     def __init__(self, seq=None, hidden=None, null_id=0):
         if seq is None:
-            self.text_outs = []
-            self.preds = [int(null_id)]
+            self.prefix = Prefix(int(null_id))
             self.text_state = hidden
             self.log_prob = 0.
         else:
-            self.text_outs = seq.text_outs[:]
-            self.preds = seq.preds[:]
+            self.prefix = seq.prefix
             self.text_state = seq.text_state
             self.log_prob = seq.log_prob
 
+    @property
+    def preds(self):
+        return self.prefix.tokens()
+
+    def extend(self, token, log_prob, text_state):
+        """
+        Return a new candidate with token appended to this one's history
+        """
+        candidate = BeamCandidate(self)
+        candidate.prefix = self.prefix.extend(int(token))
+        candidate.log_prob = log_prob
+        candidate.text_state = text_state
+        return candidate
+
+
+class TextEncoderCache:
+    """
+    Bounded LRU cache of text encoder outputs, keyed by the token history of a beam hypothesis.
+    The key fully determines (t_out, t_state), since every hypothesis starts from the same zero state.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Return the cached (t_out, t_state) for key, or None
+        """
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def retain(self, keys):
+        """
+        Drop the entries of hypotheses that left the beam
+        """
+        keys = set(keys)
+        for key in [key for key in self._entries if key not in keys]:
+            del self._entries[key]
+
+
+class EndpointConfig(collections.namedtuple('EndpointConfig', ['blank_windows', 'silence', 'energy'])):
+    """
+    When a live utterance ends; either condition is enough, None disables it:
+        blank_windows: encoder windows in a row that did not change the best hypothesis
+        silence: seconds in a row of chunks with an RMS below energy
+    """
+    __slots__ = ()
+
+    def __new__(cls, blank_windows=30, silence=None, energy=0.01):
+        return super().__new__(cls, blank_windows, silence, energy)
+
 
 class LiveModel:
     """
     Live ASR Model (real-time)
+    With endpoint set (an EndpointConfig), the text of an utterance that ended is appended to
+    context['finals'] and the token history is cleared, so that the cost of a call does not grow
+    with the length of the session. The audio encoder state and pending feature frames are kept.
+    Callers take the finals out of the context.
+    With metrics (an at16k.core.metrics.Metrics), network run times and the hypotheses expanded
+    by beam search per encoder step are recorded.
     """
 
-    def __init__(self, name, filter_non_speech=True, faster=True, beams=10):
+    def __init__(self, name, filter_non_speech=True, faster=True, beams=10, max_symbols_per_step=10,
+                 batched_beam=False, text_cache_size=256, backend='tf', fused=False, threads=None, endpoint=None,
+                 metrics=None):
         _model_dir = self._get_model_dir(name)
         _params = self._load_hparams(_model_dir)
         _vocab = self._load_vocab(_model_dir)
         self.name = name
         self._faster = faster
         self._num_beams = beams
+        # Run the text and joint encoders of beam search on several hypotheses at a time, see _beam_search().
+        self._batched_beam = batched_beam
+        # Text encoder outputs kept per stream for beam search, see TextEncoderCache.
+        self._text_cache_size = text_cache_size
+        # Upper bound on the symbols emitted for one encoder step by greedy search.
+        self._max_symbols_per_step = max_symbols_per_step
+        # Whether the frozen graphs accept a batch of streams or hypotheses; checked on first use.
+        self._batching = None
         self._filter_non_speech = filter_non_speech
-        self._inferrer = LiveInferrer(_params, _model_dir)
+        self._sample_rate = _params.get('sample_rate', 16000)
+        self._endpoint = endpoint
+        self._metrics = metrics
+        self._inferrer = LiveInferrer(_params, _model_dir, backend=backend, fused=fused, threads=threads,
+                                      metrics=metrics)
+        # Raw feature frames to the left of a frame that its delta features depend on.
+        if 'delta_context' in _params:
+            self._delta_context = _params['delta_context']
+        else:
+            self._delta_context = self._measure_delta_context()
         self._params = _params
         self._vocab = _vocab
 
+    @property
+    def sample_rate(self):
+        """
+        Sample rate of the audio the model expects
+        """
+        return self._sample_rate
+
+    def close(self):
+        """
+        Release the TensorFlow sessions
+        """
+        self._inferrer.close()
+
+    def _measure_delta_context(self):
+        """
+        Raw feature frames to the left of a frame that its delta features depend on, measured on
+        the delta network: how far to the right a change of one feature frame reaches
+        """
+        _inferrer = self._inferrer
+        # One second of audio, for the shape of the features.
+        _feats = _inferrer.infer_features(np.zeros(self._sample_rate, dtype=np.float32))
+        _feats = np.random.RandomState(0).randn(*_feats.shape).astype(np.float32)
+        _changed = _feats.copy()
+        _frame = _feats.shape[1] // 2
+        _changed[:, _frame] += 1.
+        _diff = np.abs(_inferrer.infer_delta_features(_changed) - _inferrer.infer_delta_features(_feats))
+        _reached = np.nonzero(np.max(_diff, axis=(0, 2, 3)) > 1e-6)[0]
+        return int(max(_reached[-1] - _frame, 0)) if len(_reached) else 0
+
     @staticmethod
     def _get_model_dir(name):
         if 'AT16K_RESOURCES_DIR' in os.environ:
@@ -76,6 +249,7 @@ class LiveModel:
         _inferrer = self._inferrer
         _params = self._params
         _context['feats_so_far'] = None
+        _context['feats_offset'] = 0
         _context['last_frame_processed'] = 0
         _context['symbols'] = [_params['vocab_null_id']]
         _context['last_a_state'] = np.zeros(
@@ -84,6 +258,7 @@ class LiveModel:
             inputs=[_context['symbols']], inputs_lengths=[1])
         _context['last_t_out'] = _last_t_out
         _context['last_t_state'] = _last_t_state
+        _context['finals'] = []
         return _context
 
     def _reset_context_beam(self):
@@ -91,6 +266,7 @@ class LiveModel:
         _inferrer = self._inferrer
         _params = self._params
         _context['feats_so_far'] = None
+        _context['feats_offset'] = 0
         _context['last_frame_processed'] = 0
         _context['last_a_state'] = np.zeros(
             (_params['audio_encoder_layers'], 2, 1, _params['audio_encoder_units']))
@@ -98,7 +274,8 @@ class LiveModel:
             (_params['text_encoder_layers'], 2, 1, _params['text_encoder_units']))
         _context['candidates'] = [
             BeamCandidate(seq=None, hidden=t_state, null_id=_params['vocab_null_id'])]
-
+        _context['text_cache'] = TextEncoderCache(self._text_cache_size)
+        _context['finals'] = []
         return _context
 
     def _reset_context(self):
@@ -106,9 +283,75 @@ class LiveModel:
             return self._reset_context_greedy()
         return self._reset_context_beam()
 
+    def save_context(self, context, float16=False):
+        """
+        Serialize a live context to bytes (see at16k.core.live_context), e.g. to resume the stream
+        in another process with load_context(). States are stored as float32, or float16 if requested.
+        Beam candidates are stored as one token tree, so shared histories are written once.
+        The text encoder cache is not saved.
+        """
+        values = {}
+        arrays = {}
+        for key, value in context.items():
+            if key == 'text_cache':
+                continue
+            if key == 'candidates':
+                values[key] = self._pack_candidates(value, arrays)
+            elif isinstance(value, np.ndarray):
+                arrays[key] = value
+            else:
+                values[key] = value
+        return live_context.dumps(values, arrays, float16=float16)
+
+    def load_context(self, data):
+        """
+        Rebuild a context serialized with save_context()
+        """
+        values, arrays = live_context.loads(data)
+        context = dict(values)
+        context.update((key, value) for key, value in arrays.items() if not key.startswith('candidates_'))
+        if 'candidates' in values:
+            context['candidates'] = self._unpack_candidates(values['candidates'], arrays)
+            context['text_cache'] = TextEncoderCache(self._text_cache_size)
+        return context
+
+    @staticmethod
+    def _pack_candidates(candidates, arrays):
+        _indices = {}
+        _tokens = []
+        _parents = []
+        for candidate in candidates:
+            _chain = []
+            node = candidate.prefix
+            while node is not None and id(node) not in _indices:
+                _chain.append(node)
+                node = node.parent
+            for node in reversed(_chain):
+                _indices[id(node)] = len(_tokens)
+                _tokens.append(node.token)
+                _parents.append(-1 if node.parent is None else _indices[id(node.parent)])
+        arrays['candidates_tokens'] = np.array(_tokens, dtype=np.int32)
+        arrays['candidates_parents'] = np.array(_parents, dtype=np.int32)
+        arrays['candidates_text_states'] = np.concatenate([c.text_state for c in candidates], axis=2)
+        return {'nodes': [_indices[id(c.prefix)] for c in candidates],
+                'log_probs': [float(c.log_prob) for c in candidates]}
+
+    @staticmethod
+    def _unpack_candidates(values, arrays):
+        _nodes = []
+        for token, parent in zip(arrays['candidates_tokens'].tolist(), arrays['candidates_parents'].tolist()):
+            _nodes.append(Prefix(token, None if parent < 0 else _nodes[parent]))
+        candidates = []
+        for j, (node, log_prob) in enumerate(zip(values['nodes'], values['log_probs'])):
+            candidate = BeamCandidate(hidden=arrays['candidates_text_states'][:, :, j:(j + 1)])
+            candidate.prefix = _nodes[node]
+            candidate.log_prob = log_prob
+            candidates.append(candidate)
+        return candidates
+
     def _do_greedy_search(self, _a_out, _params, context):
         _inferrer = self._inferrer
-        while True:
+        for _ in range(self._max_symbols_per_step):
             _logits, _probs = _inferrer.infer_joint_encoder(
                 a_inputs=_a_out, t_inputs=context['last_t_out'])
             _probs = np.squeeze(_probs)
@@ -124,91 +367,328 @@ class LiveModel:
             context['last_t_state'] = _t_state
         return context
 
-    def _do_beam_search(self, _a_out, _params, context):
+    def _text_cache(self, context):
+        if 'text_cache' not in context:
+            context['text_cache'] = TextEncoderCache(self._text_cache_size)
+        return context['text_cache']
+
+    def _beam_search(self, _a_out, _params, context, speculate=False):
+        """
+        Generator running the beam search of one encoder step on a context. It yields lists of
+        hypotheses whose text encoder and joint network outputs it needs, and is sent back a dict
+        from their prefixes to (text state, log-probs), see _expand() and _run_searches().
+        Without speculate, it asks for the hypothesis it expands next only. With speculate, it also
+        asks for the best hypotheses waiting in the heap, at most as many as it may still expand,
+        so that the networks run on several hypotheses at a time. The expansions and the result
+        are the same either way; speculative outputs the search does not reach are left unused.
+        """
         beam_width = self._num_beams
-        _inferrer = self._inferrer
-        prefix_candidates = list(context['candidates'])
+        _null_id = _params['vocab_null_id']
+        _min_log_prob = np.log(1e-3)
+        _cache = self._text_cache(context)
+        # Max-heap of hypotheses to expand, ordered by log-prob; the counter breaks ties.
+        _counter = itertools.count()
+        prefix_candidates = [(-y_hat.log_prob, next(_counter), y_hat) for y_hat in context['candidates']]
+        heapq.heapify(prefix_candidates)
+        _outputs = {}
         candidates = []
+        # Min-heap of the beam_width best finished scores.
+        scores = []
         loop_num = 0
         while True:
             loop_num += 1
             if not prefix_candidates:
                 break
-            y_hat = max(prefix_candidates, key=lambda a: a.log_prob)
-            prefix_candidates.remove(y_hat)
-            _t_out, _t_state = _inferrer.infer_text_encoder(
-                inputs=[[y_hat.preds[-1]]], inputs_lengths=[1], inputs_states=y_hat.text_state)
-            _logits, _probs = _inferrer.infer_joint_encoder(
-                a_inputs=_a_out, t_inputs=_t_out)
+            y_hat = heapq.heappop(prefix_candidates)[2]
+            if y_hat.prefix not in _outputs:
+                wanted = [y_hat]
+                if speculate:
+                    wanted.extend(item[2] for item in heapq.nsmallest(beam_width + 1 - loop_num, prefix_candidates)
+                                  if item[2].prefix not in _outputs)
+                _outputs.update((yield wanted))
+            _t_state, _probs = _outputs[y_hat.prefix]
 
-            _probs = np.squeeze(_probs)
             candidate = BeamCandidate(y_hat)
-            candidate.log_prob += _probs[_params['vocab_null_id']]
+            candidate.log_prob += _probs[_null_id]
             candidates.append(candidate)
-            pruned = np.where(_probs > np.log(1e-3))[0]
+            heapq.heappush(scores, candidate.log_prob)
+            if len(scores) > beam_width:
+                heapq.heappop(scores)
+            pruned = np.where(_probs > _min_log_prob)[0]
 
             for k in pruned:
-                if k == _params['vocab_null_id']:
+                if k == _null_id:
                     continue
-                candidate = BeamCandidate(y_hat)
-                candidate.log_prob += _probs[k]
-                candidate.text_state = _t_state
-                candidate.preds.append(int(k))
-                candidate.text_outs.append(_t_out)
-                prefix_candidates.append(candidate)
+                candidate = y_hat.extend(k, y_hat.log_prob + _probs[k], _t_state)
+                heapq.heappush(prefix_candidates, (-candidate.log_prob, next(_counter), candidate))
             best_score = -np.inf
             if prefix_candidates:
-                y_hat = max(prefix_candidates, key=lambda a: a.log_prob)
-                best_score = y_hat.log_prob
+                best_score = -prefix_candidates[0][0]
 
-            scores = [a.log_prob for a in candidates]
-            scores.sort(reverse=True)
-            scores = scores[:beam_width]
-            min_score = min(scores)
+            min_score = scores[0]
             if (len(candidates) >= beam_width and min_score >= best_score) or (loop_num > beam_width):
                 break
-        candidates = sorted(candidates, key=lambda a: a.log_prob / len(a.preds), reverse=True)
+        if self._metrics is not None:
+            self._metrics.observe_expansions(len(candidates))
+        candidates = sorted(candidates, key=lambda a: a.log_prob / len(a.prefix), reverse=True)
         candidates = candidates[:beam_width]
         context['candidates'] = candidates
+        _cache.retain(y_hat.prefix for y_hat in candidates)
+
+    def _expand(self, requests):
+        """
+        Run the text encoder and the joint network once on the hypotheses of several beam searches.
+        requests holds (audio encoder output, context, hypotheses) per search; the text encoder only
+        runs on the hypotheses missing from the text cache of their context.
+        Returns, per search, a dict from prefix to (text state, log-probs).
+        """
+        _inferrer = self._inferrer
+        _rows = []
+        for r, (_a_out, context, hypotheses) in enumerate(requests):
+            _cache = self._text_cache(context)
+            _rows.extend([r, y_hat, _cache.get(y_hat.prefix)] for y_hat in hypotheses)
+        _missing = [row for row in _rows if row[2] is None]
+        if _missing:
+            _t_outs, _t_states = _inferrer.infer_text_encoder(
+                inputs=[[row[1].prefix.token] for row in _missing], inputs_lengths=[1] * len(_missing),
+                inputs_states=np.concatenate([row[1].text_state for row in _missing], axis=2))
+            for k, row in enumerate(_missing):
+                row[2] = (_t_outs[k:(k + 1)], _t_states[:, :, k:(k + 1)])
+                self._text_cache(requests[row[0]][1]).put(row[1].prefix, row[2])
+        _logits, _probs = _inferrer.infer_joint_encoder(
+            a_inputs=np.concatenate([requests[row[0]][0] for row in _rows], axis=0),
+            t_inputs=np.concatenate([row[2][0] for row in _rows], axis=0))
+        _probs = np.reshape(_probs, (len(_rows), -1))
+        results = [{} for _ in requests]
+        for (r, y_hat, _cached), _row_probs in zip(_rows, _probs):
+            results[r][y_hat.prefix] = (_cached[1], _row_probs)
+        return results
+
+    def _run_searches(self, searches):
+        """
+        Run beam search generators (see _beam_search) of (audio encoder output, context) pairs
+        together, expanding the hypotheses they ask for at the same time in one batch
+        """
+        requests = {}
+        for k, item in enumerate(searches):
+            try:
+                requests[k] = next(item[0])
+            except StopIteration:
+                pass
+        while requests:
+            _keys = list(requests)
+            results = self._expand([(searches[k][1], searches[k][2], requests[k]) for k in _keys])
+            for k, result in zip(_keys, results):
+                try:
+                    requests[k] = searches[k][0].send(result)
+                except StopIteration:
+                    del requests[k]
+
+    def _do_beam_search(self, _a_out, _params, context, speculate=False):
+        self._run_searches([(self._beam_search(_a_out, _params, context, speculate), _a_out, context)])
         return context
 
-    def __call__(self, samples, context=None):
-        _params = self._params
+    def _search(self, _a_out, _params, context):
+        if self._faster:
+            return self._do_greedy_search(_a_out, _params, context)
+        # Batched beam search needs graphs with a free batch dimension, see _supports_batching().
+        return self._do_beam_search(_a_out, _params, context, speculate=self._batched_beam and bool(self._batching))
+
+    # Defining a couple of constants. These are derived from the CNN layer applied over the delta features.
+    _window_size = 15
+    _step_size = 3
+
+    def _extract_windows(self, samples, context):
+        """
+        Compute features for a new chunk of samples and return the encoder windows that became available.
+        The context only keeps the raw feature frames that later windows and their delta features need:
+        feats_so_far starts at the absolute frame feats_offset, while last_frame_processed stays absolute.
+        """
         _inferrer = self._inferrer
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        if self._endpoint is not None and self._endpoint.silence and len(samples):
+            _silent = np.sqrt(np.mean(np.square(samples))) < self._endpoint.energy
+            context['silent_samples'] = context.get('silent_samples', 0) + len(samples) if _silent else 0
+        context['feats_so_far'], _delta_feats = _inferrer.infer_feature_deltas(samples, context['feats_so_far'])
+        _offset = context.get('feats_offset', 0)
+        _start = context['last_frame_processed'] - _offset
+        _windows = []
+        while (_start + self._window_size) <= _delta_feats.shape[1]:
+            _windows.append(_delta_feats[:, _start:(_start + self._window_size), :, :])
+            _start += self._step_size
+        context['last_frame_processed'] = _offset + _start
+        # Drop the frames that are neither in a pending window nor in the delta context of one.
+        _drop = _start - self._delta_context
+        if _drop > 0:
+            context['feats_so_far'] = context['feats_so_far'][:, _drop:]
+            context['feats_offset'] = _offset + _drop
+        return _windows
+
+    def _decode_text(self, context):
         _vocab = self._vocab
+        if self._faster:
+            return _vocab.DecodeIds(context['symbols'][1:])
+        _candidates = sorted(context['candidates'], key=lambda a: a.log_prob / len(a.prefix), reverse=True)
+        _top_candidate = _candidates[0]
+        return _vocab.DecodeIds(_top_candidate.preds[1:])
 
+    def __call__(self, samples, context=None):
+        """
+        Decode the next chunk of samples (1-D float32 array, or any array-like convertible to one).
+        Returns the text decoded so far and the updated context.
+        """
         if context is None:
             context = self._reset_context()
-        _feats = _inferrer.infer_features(samples)
-        if context['feats_so_far'] is None:
-            context['feats_so_far'] = _feats
-        else:
-            context['feats_so_far'] = np.concatenate(
-                [context['feats_so_far'], _feats], axis=1)
-        _start = context['last_frame_processed']
-        _delta_feats = _inferrer.infer_delta_features(context['feats_so_far'])
+        for _w_feats in self._extract_windows(samples, context):
+            context = self._decode_window(_w_feats, context)
+        return self._decode_text(context), context
+
+    def _decode_window(self, _w_feats, context):
+        _params = self._params
+        _inferrer = self._inferrer
+        if self._batched_beam and not self._faster:
+            self._supports_batching(_w_feats)
+        _a_out, _a_state = _inferrer.infer_audio_encoder(
+            inputs=_w_feats, inputs_states=context['last_a_state'])
+        _before = self._utterance_marker(context)
+        context = self._search(_a_out, _params, context)
+        context['last_a_state'] = _a_state
+        self._check_endpoint(context, _before)
+        return context
 
-        # Defining a couple of constants. These are derived from the CNN layer applied over the delta features.
-        _window_size = 15
-        _step_size = 3
+    def _utterance_marker(self, context):
+        """
+        Value that changes whenever the best hypothesis of the current utterance changes
+        """
+        if self._endpoint is None:
+            return None
+        if self._faster:
+            return len(context['symbols'])
+        return max(context['candidates'], key=lambda a: a.log_prob / len(a.prefix)).prefix
 
-        while True:
-            if (_start + _window_size) > _delta_feats.shape[1]:
+    def _check_endpoint(self, context, before):
+        _endpoint = self._endpoint
+        if _endpoint is None:
+            return
+        _marker = self._utterance_marker(context)
+        context['blank_windows'] = 0 if _marker != before else context.get('blank_windows', 0) + 1
+        # Only utterances with at least one symbol besides the initial null are finalized.
+        if (_marker if self._faster else len(_marker)) <= 1:
+            return
+        _blank = _endpoint.blank_windows and context['blank_windows'] >= _endpoint.blank_windows
+        _silent = _endpoint.silence and context.get('silent_samples', 0) >= _endpoint.silence * self._sample_rate
+        if _blank or _silent:
+            self._finalize(context)
+
+    def _finalize(self, context):
+        """
+        Move the text of the current utterance to context['finals'] and start a new utterance,
+        keeping the audio encoder state and the pending feature frames
+        """
+        context.setdefault('finals', []).append(self._decode_text(context))
+        _fresh = self._reset_context()
+        for key in ('symbols', 'last_t_out', 'last_t_state', 'candidates', 'text_cache'):
+            if key in _fresh:
+                context[key] = _fresh[key]
+        context['blank_windows'] = 0
+        context['silent_samples'] = 0
+
+    def _do_batched_greedy_search(self, _a_outs, _params, contexts):
+        """
+        Greedy search for several streams at once: one joint and one text encoder run per emitted symbol step
+        """
+        _inferrer = self._inferrer
+        _pending = list(range(len(contexts)))
+        for _ in range(self._max_symbols_per_step):
+            _logits, _probs = _inferrer.infer_joint_encoder(
+                a_inputs=np.concatenate([_a_outs[i] for i in _pending], axis=0),
+                t_inputs=np.concatenate([contexts[i]['last_t_out'] for i in _pending], axis=0))
+            _symbols = np.argmax(np.reshape(_probs, (len(_pending), -1)), axis=1)
+            _emitted = [(i, int(_symbol)) for i, _symbol in zip(_pending, _symbols)
+                        if _symbol not in (_params['vocab_null_id'], _params['vocab_eos_id'])]
+            if not _emitted:
                 break
-            _w_feats = _delta_feats[:, _start:(_start + _window_size), :, :]
+            _pending = [i for i, _ in _emitted]
+            for i, _symbol in _emitted:
+                contexts[i]['symbols'].append(_symbol)
+            _t_outs, _t_states = _inferrer.infer_text_encoder(
+                inputs=[[_symbol] for _, _symbol in _emitted], inputs_lengths=[1] * len(_emitted),
+                inputs_states=np.concatenate([contexts[i]['last_t_state'] for i in _pending], axis=2))
+            for j, i in enumerate(_pending):
+                contexts[i]['last_t_out'] = _t_outs[j:(j + 1)]
+                contexts[i]['last_t_state'] = _t_states[:, :, j:(j + 1)]
+        return contexts
+
+    def _supports_batching(self, _w_feats):
+        """
+        Run each encoder once on a batch of two streams to find out whether the graphs
+        have a free batch dimension. The result is cached.
+        """
+        if self._batching is not None:
+            return self._batching
+        _params = self._params
+        _inferrer = self._inferrer
+        try:
             _a_out, _a_state = _inferrer.infer_audio_encoder(
-                inputs=_w_feats, inputs_states=context['last_a_state'])
+                inputs=np.concatenate([_w_feats, _w_feats], axis=0),
+                inputs_states=np.zeros(
+                    (_params['audio_encoder_layers'], 2, 2, _params['audio_encoder_units'])))
+            _t_out, _t_state = _inferrer.infer_text_encoder(
+                inputs=[[_params['vocab_null_id']]] * 2, inputs_lengths=[1, 1],
+                inputs_states=np.zeros(
+                    (_params['text_encoder_layers'], 2, 2, _params['text_encoder_units'])))
+            _logits, _probs = _inferrer.infer_joint_encoder(a_inputs=_a_out, t_inputs=_t_out)
+            self._batching = (_a_out.shape[0] == 2 and _a_state.shape[2] == 2 and
+                              _t_out.shape[0] == 2 and _t_state.shape[2] == 2 and _probs.shape[0] == 2)
+        except Exception:  # pylint: disable=broad-except
+            # Graphs exported with a fixed batch size of 1 reject the batch at feed time.
+            self._batching = False
+        return self._batching
+
+    def batch_call(self, samples_list, contexts=None):
+        """
+        Decode the next chunk of samples for several independent streams at once.
+        At every step the pending encoder windows of all streams are stacked into one batch,
+        so each encoder runs once per step instead of once per stream. In beam mode, the beam
+        searches of the streams run together and their text and joint encoder inputs are
+        batched across streams (see _run_searches).
+        Falls back to decoding the streams one by one if the graphs only accept a batch of 1.
+        Returns a list of texts and the list of updated contexts.
+        """
+        _params = self._params
+        _inferrer = self._inferrer
+
+        if contexts is None:
+            contexts = [None] * len(samples_list)
+        contexts = [self._reset_context() if context is None else context for context in contexts]
+        _windows = [self._extract_windows(samples, context) for samples, context in zip(samples_list, contexts)]
+        _first = [item[0] for item in _windows if item]
+        _probe = len(_first) > 1 or (_first and self._batched_beam and not self._faster)
+        if _probe and not self._supports_batching(_first[0]):
+            _texts = []
+            for i, context in enumerate(contexts):
+                for _w_feats in _windows[i]:
+                    self._decode_window(_w_feats, context)
+                _texts.append(self._decode_text(context))
+            return _texts, contexts
+        _step = 0
+        while True:
+            _active = [i for i, item in enumerate(_windows) if _step < len(item)]
+            if not _active:
+                break
+            _a_outs, _a_states = _inferrer.infer_audio_encoder(
+                inputs=np.concatenate([_windows[i][_step] for i in _active], axis=0),
+                inputs_states=np.concatenate([contexts[i]['last_a_state'] for i in _active], axis=2))
+            _a_outs = [_a_outs[j:(j + 1)] for j in range(len(_active))]
+            _before = [self._utterance_marker(contexts[i]) for i in _active]
             if self._faster:
-                context = self._do_greedy_search(_a_out, _params, context)
+                self._do_batched_greedy_search(_a_outs, _params, [contexts[i] for i in _active])
             else:
-                context = self._do_beam_search(_a_out, _params, context)
-            context['last_a_state'] = _a_state
-            _start += _step_size
-        context['last_frame_processed'] = _start
-        if self._faster:
-            _text = _vocab.DecodeIds(context['symbols'][1:])
-        else:
-            _candidates = sorted(context['candidates'], key=lambda a: a.log_prob / len(a.preds), reverse=True)
-            _top_candidate = _candidates[0]
-            _text = _vocab.DecodeIds(_top_candidate.preds[1:])
-        return _text, context
+                _speculate = self._batched_beam and bool(self._batching)
+                self._run_searches([(self._beam_search(_a_outs[j], _params, contexts[i], _speculate),
+                                     _a_outs[j], contexts[i]) for j, i in enumerate(_active)])
+            for j, i in enumerate(_active):
+                contexts[i]['last_a_state'] = _a_states[:, :, j:(j + 1)]
+                self._check_endpoint(contexts[i], _before[j])
+            _step += 1
+        return [self._decode_text(context) for context in contexts], contexts
@@ -0,0 +1,89 @@
+"""
+Cross-stream batching for live models
+"""
+
+import queue
+import threading
+import time
+
+
+class _Request:
+    """
+    A chunk of samples waiting to be decoded
+    """
+
+    def __init__(self, samples, context):
+        self.samples = samples
+        self.context = context
+        self.text = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class LiveScheduler:
+    """
+    Decode chunks submitted concurrently by many streams with one LiveModel.batch_call per tick.
+    A tick starts with the first pending chunk and collects the chunks that arrive within
+    max_wait seconds, up to max_batch of them.
+    Calling the scheduler is equivalent to calling the model, and blocks until the chunk is decoded.
+    Each stream must submit its next chunk only after the previous one returned.
+    """
+
+    def __init__(self, model, max_batch=32, max_wait=0.005):
+        self._model = model
+        self._max_batch = max_batch
+        self._max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __call__(self, samples, context=None):
+        request = _Request(samples, context)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.text, request.context
+
+    def close(self):
+        """
+        Stop the scheduler thread once the pending chunks are decoded
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, request):
+        batch = [request]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                # Keep the stop marker for the main loop.
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = self._collect(request)
+            try:
+                texts, contexts = self._model.batch_call([item.samples for item in batch],
+                                                         [item.context for item in batch])
+                for item, text, context in zip(batch, texts, contexts):
+                    item.text = text
+                    item.context = context
+            except Exception as error:  # pylint: disable=broad-except
+                for item in batch:
+                    item.error = error
+            for item in batch:
+                item.done.set()
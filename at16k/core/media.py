@@ -2,45 +2,238 @@
 Audio file handler
 """
 
+import math
 import scipy.io.wavfile as wavfile
 import numpy as np
+from at16k.utils.lazy_import import LazyModule
+
+# Only imported when resampling, it adds about a second to import time.
+signal = LazyModule('scipy.signal')
+
+
+# Sample formats of raw PCM input, see iter_raw_chunks().
+RAW_FORMATS = {
+    's16le': '<i2',
+    'f32le': '<f4'
+}
+
+
+def iter_raw_chunks(stream, chunk_size, dtype='<i2'):
+    """
+    Read raw mono PCM from a binary stream (e.g. stdin or a named pipe) in reads of chunk_size samples.
+    Yields the bytes of each chunk; every chunk but the last holds exactly chunk_size samples,
+    and a trailing partial sample is dropped.
+    """
+    assert chunk_size > 0, 'chunk_size must be a positive integer'
+    sample_size = np.dtype(dtype).itemsize
+    num_bytes = chunk_size * sample_size
+    while True:
+        chunk = b''
+        while len(chunk) < num_bytes:
+            # Pipes may return fewer bytes than asked for before the end of the stream.
+            data = stream.read(num_bytes - len(chunk))
+            if not data:
+                break
+            chunk += data
+        usable = len(chunk) - len(chunk) % sample_size
+        if usable:
+            yield chunk[:usable]
+        if len(chunk) < num_bytes:
+            return
+
+
+def _rate_factors(orig_rate, target_rate):
+    gcd = math.gcd(int(orig_rate), int(target_rate))
+    return int(target_rate) // gcd, int(orig_rate) // gcd
+
+
+def _cast(waveform, dtype):
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        waveform = np.clip(np.round(waveform), info.min, info.max)
+    return waveform.astype(dtype)
+
+
+def resample(waveform, orig_rate, target_rate):
+    """
+    Resample a waveform (along its first axis) from orig_rate to target_rate with a polyphase filter.
+    Integer waveforms are rounded and clipped to their dtype; the dtype is kept.
+    """
+    if orig_rate == target_rate:
+        return waveform
+    up, down = _rate_factors(orig_rate, target_rate)
+    return _cast(signal.resample_poly(waveform, up, down, axis=0), waveform.dtype)
+
+
+class StreamingResampler:
+    """
+    Resample a mono stream chunk by chunk with the filter of resample(): the outputs of all calls
+    followed by flush() match resample() on the whole stream. Each output waits for the inputs
+    under its filter, i.e. 10 samples at the higher of both rates divided by their gcd.
+    The stream state lives in a dict of plain values under the resampler_* keys (e.g. a live
+    context), so that the resampler itself is shared by any number of streams.
+    """
+
+    def __init__(self, orig_rate, target_rate):
+        self.orig_rate = orig_rate
+        self.target_rate = target_rate
+        self._up, self._down = _rate_factors(orig_rate, target_rate)
+        max_rate = max(self._up, self._down)
+        self._delay = 10 * max_rate
+        taps = signal.firwin(2 * self._delay + 1, 1. / max_rate, window=('kaiser', 5.0)) * self._up
+        # _phases[p, t] is tap p + t * up: the taps applied to the inputs of outputs at phase p.
+        self._num_taps = -(-len(taps) // self._up)
+        padded = np.zeros(self._num_taps * self._up)
+        padded[:len(taps)] = taps
+        self._phases = padded.reshape(self._num_taps, self._up).T
+
+    def __call__(self, samples, state):
+        """
+        Resample the next chunk of samples; returns the outputs it completed (float32).
+        state is updated in place; pass an empty dict for a new stream.
+        """
+        samples = np.asarray(samples, dtype=np.float32).ravel()
+        consumed = state.get('resampler_consumed', 0) + len(samples)
+        buffer = np.concatenate([self._buffer(state), samples])
+        end = max(0, -(-(consumed * self._up - self._delay) // self._down))
+        return self._produce(buffer, consumed, end, state)
+
+    def flush(self, state):
+        """
+        Return the outputs still waiting for inputs at the end of a stream
+        """
+        consumed = state.get('resampler_consumed', 0)
+        end = -(-consumed * self._up // self._down)
+        return self._produce(self._buffer(state), consumed, end, state)
+
+    def _buffer(self, state):
+        if 'resampler_buffer' in state:
+            return state['resampler_buffer']
+        # Zeros before the first sample.
+        return np.zeros(self._num_taps - 1, dtype=np.float32)
+
+    def _produce(self, buffer, consumed, end, state):
+        produced = state.get('resampler_produced', 0)
+        start = consumed - len(buffer)
+        outputs = np.arange(produced, max(end, produced))
+        positions = outputs * self._down + self._delay
+        last = positions // self._up - start
+        phases = self._phases[positions % self._up]
+        if len(outputs) and last[-1] >= len(buffer):
+            # Zeros after the last sample, when flushing.
+            buffer = np.concatenate([buffer, np.zeros(last[-1] + 1 - len(buffer), dtype=np.float32)])
+        resampled = np.zeros(len(outputs))
+        for tap in range(self._num_taps):
+            resampled += phases[:, tap] * buffer[last - tap]
+        first_needed = (max(end, produced) * self._down + self._delay) // self._up - self._num_taps + 1
+        state['resampler_buffer'] = buffer[max(0, first_needed - start):(consumed - start)]
+        state['resampler_consumed'] = consumed
+        state['resampler_produced'] = max(end, produced)
+        return resampled.astype(np.float32)
 
 
 class Media:
     """
     Media: I/O functionality to read/write audio files
+    The file is read once: the PCM data is memory-mapped and the converted
+    waveform is cached on first use.
+    With sample_rate set, the waveform and chunks are resampled to it (see resample()).
     """
 
-    def __init__(self, file_path, dtype=None):
+    def __init__(self, file_path, dtype=None, sample_rate=None):
         self.file_path = file_path
         self._dtype = dtype
+        self._target_rate = sample_rate
+        self._sample_rate = None
+        self._data = None
+        self._waveform = None
+
+    def _read(self):
+        if self._data is not None:
+            return
+        try:
+            sample_rate, data = wavfile.read(self.file_path, mmap=True)
+        except ValueError:
+            # Formats that cannot be memory-mapped (e.g. 24-bit PCM) are decoded in memory.
+            sample_rate, data = wavfile.read(self.file_path)
+        self._sample_rate = sample_rate
+        self._data = data
+
+    def _convert(self, data):
+        """
+        Downmix to mono and convert to the requested dtype.
+        Returns a view of data when no conversion is needed.
+        """
+        # The scale comes from the stored sample format; downmixing yields floats.
+        scale = None
+        if self._dtype is not None and np.issubdtype(data.dtype, np.integer):
+            scale = np.iinfo(data.dtype).max
+        if data.ndim > 1:
+            data = np.mean(data, axis=1)
+        if self._dtype is None or (scale is None and data.dtype == self._dtype):
+            return data
+        if scale is not None:
+            return data.astype(self._dtype) / scale
+        return data.astype(self._dtype)
+
+    def _resampling(self):
+        self._read()
+        return self._target_rate is not None and self._target_rate != self._sample_rate
 
     @property
     def sample_rate(self):
         """
-        Sample rate of audio file
+        Sample rate of the waveform (the requested rate, or that of the audio file)
         """
-        sample_rate, _ = wavfile.read(self.file_path)
-        return sample_rate
+        self._read()
+        return self._target_rate or self._sample_rate
 
     @property
     def waveform(self):
         """
         Raw waveform of entire audio file
         """
-        _, waveform = wavfile.read(self.file_path)
-        shape = np.shape(waveform)
-        if len(shape) > 1:
-            waveform = np.mean(waveform, axis=1)
-        if self._dtype is None:
-            return waveform
-        if waveform.dtype not in [self._dtype]:
-            waveform = waveform.astype(self._dtype) / np.iinfo(waveform.dtype).max
-        return waveform
+        if self._waveform is None:
+            self._read()
+            waveform = self._convert(self._data)
+            if self._resampling():
+                waveform = resample(waveform, self._sample_rate, self._target_rate)
+            self._waveform = waveform
+        return self._waveform
 
     @property
     def duration(self):
         """
         Length of the audio file (in seconds)
         """
-        return len(self.waveform) / float(self.sample_rate)
+        self._read()
+        return len(self._data) / float(self._sample_rate)
+
+    def iter_chunks(self, chunk_size):
+        """
+        Yield consecutive chunks of chunk_size samples (the last one may be shorter).
+        Chunks are views of the memory-mapped data whenever the file is already
+        mono and in the requested dtype; otherwise each chunk is converted on its own,
+        so the whole file is never converted at once.
+        When resampling, chunk_size samples of the file are resampled at a time, so the chunks
+        hold about chunk_size * sample_rate / (file sample rate) samples.
+        """
+        assert chunk_size > 0, 'chunk_size must be a positive integer'
+        self._read()
+        if self._resampling() and self._waveform is None:
+            for chunk in self._iter_resampled_chunks(chunk_size):
+                yield chunk
+            return
+        data = self._data if self._waveform is None else self._waveform
+        for start in range(0, len(data), chunk_size):
+            yield self._convert(data[start:(start + chunk_size)])
+
+    def _iter_resampled_chunks(self, chunk_size):
+        resampler = StreamingResampler(self._sample_rate, self._target_rate)
+        state = {}
+        for start in range(0, len(self._data), chunk_size):
+            chunk = self._convert(self._data[start:(start + chunk_size)])
+            resampled = resampler(chunk, state)
+            if start + chunk_size >= len(self._data):
+                resampled = np.concatenate([resampled, resampler.flush(state)])
+            yield _cast(resampled, chunk.dtype)
@@ -0,0 +1,129 @@
+"""
+Timing counters of live models, see LiveInferrer and LiveModel
+"""
+
+import bisect
+import threading
+
+# Upper bounds (in seconds) of the latency histogram buckets of a network run.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5)
+
+# Upper bounds of the histogram buckets of the hypotheses expanded by beam search per encoder step.
+EXPANSION_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Network keys of LiveInferrer; fd is a fused features and delta features run.
+NETWORKS = {
+    'f': 'features',
+    'd': 'delta_features',
+    'fd': 'fused_features',
+    'a': 'audio_encoder',
+    't': 'text_encoder',
+    'j': 'joint_network'
+}
+
+
+class Histogram:
+    """
+    Count, sum and bucket counts of observed values (bucket i counts values <= buckets[i])
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        # The last count is the +Inf bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """
+        (upper bound, number of values <= upper bound) pairs, ending with ('+Inf', count)
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'buckets': self.cumulative()}
+
+
+class Metrics:
+    """
+    Thread-safe counters shared by the live models that are given the same instance:
+        network runs: count, total seconds and latency histogram per LiveInferrer network key
+        beam expansions: histogram of the hypotheses beam search expanded per encoder step
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, expansion_buckets=EXPANSION_BUCKETS):
+        self._latency_buckets = latency_buckets
+        self._expansion_buckets = expansion_buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counters
+        """
+        with self._lock:
+            self._latency = {}
+            self._expansions = Histogram(self._expansion_buckets)
+
+    def observe_latency(self, key, seconds):
+        """
+        Record a run of the network key that took seconds
+        """
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self._latency_buckets)
+            histogram.observe(seconds)
+
+    def observe_expansions(self, count):
+        """
+        Record the number of hypotheses beam search expanded for one encoder step
+        """
+        with self._lock:
+            self._expansions.observe(count)
+
+    def snapshot(self):
+        """
+        Current counters as a JSON-compatible dict:
+            {"networks": {key: {"count", "sum", "buckets"}}, "beam_expansions": {"count", "sum", "buckets"}}
+        where buckets are cumulative [upper bound, count] pairs
+        """
+        with self._lock:
+            return {
+                'networks': {key: histogram.snapshot() for key, histogram in self._latency.items()},
+                'beam_expansions': self._expansions.snapshot()
+            }
+
+    def to_prometheus(self):
+        """
+        Current counters in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = ['# HELP at16k_network_seconds Time spent running each network of the live model.',
+                 '# TYPE at16k_network_seconds histogram']
+        for key in sorted(snapshot['networks']):
+            labels = 'network="%s"' % NETWORKS.get(key, key)
+            lines.extend(_histogram_lines('at16k_network_seconds', labels, snapshot['networks'][key]))
+        lines.extend(['# HELP at16k_beam_expansions Hypotheses expanded by beam search per encoder step.',
+                      '# TYPE at16k_beam_expansions histogram'])
+        lines.extend(_histogram_lines('at16k_beam_expansions', '', snapshot['beam_expansions']))
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, labels, snapshot):
+    prefix = labels + ',' if labels else ''
+    lines = ['%s_bucket{%sle="%s"} %d' % (name, prefix, bound, count) for bound, count in snapshot['buckets']]
+    suffix = '{%s}' % labels if labels else ''
+    lines.append('%s_sum%s %r' % (name, suffix, float(snapshot['sum'])))
+    lines.append('%s_count%s %d' % (name, suffix, snapshot['count']))
+    return lines
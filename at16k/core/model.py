@@ -5,21 +5,139 @@ Load models for ASR
 import os
 from pathlib import Path
 
-import tensorflow as tf
+import numpy as np
+from at16k.core.threads import session_config
+from at16k.utils.lazy_import import LazyModule
 from at16k.utils.text_encoder import SubwordTextEncoder
 
+tf = LazyModule('tensorflow')
+
+# Optional frozen graph, next to the SavedModel export, that takes waveforms directly.
+# Written by prepare_waveform_graph().
+WAVEFORM_GRAPH = 'waveform.graph.pb'
+
+
+def _latest_export(model_dir):
+    model_path = os.path.join(model_dir, 'export')
+    sub_dirs = os.listdir(model_path)
+    sub_dirs.sort()
+    return os.path.join(model_path, sub_dirs[-1])
+
+
+def _waveform_features(parse_outputs, keys, num_sparse, waveforms, lengths):
+    """
+    Map the output names of a ParseExample op (parse_outputs) that reads the waveforms feature to
+    equivalent tensors computed from waveforms and lengths. keys are the sparse then dense keys.
+    ParseExample outputs the sparse indices, values and shapes, then the dense values.
+    """
+    if b'waveforms' not in keys:
+        raise ValueError('The serving graph does not parse a waveforms feature')
+    idx = keys.index(b'waveforms')
+    if idx >= num_sparse:
+        return {parse_outputs[2 * num_sparse + idx]: waveforms}
+    mask = tf.sequence_mask(lengths, tf.shape(waveforms)[1])
+    return {
+        parse_outputs[idx]: tf.where(mask),
+        parse_outputs[num_sparse + idx]: tf.boolean_mask(waveforms, mask),
+        parse_outputs[2 * num_sparse + idx]: tf.cast(tf.shape(waveforms), tf.int64)
+    }
+
+
+def prepare_waveform_graph(model_dir):
+    """
+    Write the WaveformGraph of an offline model (WAVEFORM_GRAPH) to model_dir, so that Model loads it
+    as waveform_fn. The graph is the frozen serving graph of the latest SavedModel export, with the
+    tf.train.Example parsing of the waveforms feature replaced by the waveforms and lengths inputs.
+    Returns its path.
+    """
+    with tf.Graph().as_default() as graph, tf.Session(graph=graph) as session:
+        meta_graph = tf.saved_model.loader.load(session, [tf.saved_model.tag_constants.SERVING],
+                                                _latest_export(model_dir))
+        signature = meta_graph.signature_def['serving_default']
+        output_names = [signature.outputs[key].name for key in ['outputs', 'scores']]
+        parse_ops = [op for op in graph.get_operations() if op.type == 'ParseExample']
+        if len(parse_ops) != 1:
+            raise ValueError('Expected one ParseExample op in the serving graph, found %d' % len(parse_ops))
+        parse_op = parse_ops[0]
+        num_sparse = parse_op.get_attr('Nsparse')
+        # Inputs of ParseExample: serialized, names, sparse keys, dense keys, dense defaults.
+        keys = session.run(list(parse_op.inputs[2:(2 + num_sparse + parse_op.get_attr('Ndense'))]))
+        parse_outputs = [output.name for output in parse_op.outputs]
+        frozen_def = tf.graph_util.convert_variables_to_constants(
+            session, graph.as_graph_def(), [name.split(':')[0] for name in output_names])
+    with tf.Graph().as_default() as graph:
+        waveforms = tf.placeholder(tf.float32, [None, None], name='waveforms')
+        lengths = tf.placeholder(tf.int32, [None], name='lengths')
+        input_map = _waveform_features(parse_outputs, list(keys), num_sparse, waveforms, lengths)
+        outputs, scores = tf.import_graph_def(frozen_def, input_map=input_map, return_elements=output_names,
+                                              name='serving')
+        tf.identity(outputs, name='outputs')
+        tf.identity(scores, name='scores')
+    graph_path = os.path.join(model_dir, WAVEFORM_GRAPH)
+    with tf.gfile.GFile(graph_path, "wb") as f:
+        f.write(graph.as_graph_def().SerializeToString())
+    return graph_path
+
+
+class WaveformGraph():
+    """Frozen inference graph fed with waveforms instead of serialized tf.train.Example protos
+    Inputs:
+        waveforms: float32, [batch, time], zero padded
+        lengths: int32, [batch], number of valid samples of each waveform
+    Outputs:
+        outputs: int, [batch, ids], predicted ids
+        scores: float32, [batch]
+    """
+
+    def __init__(self, graph_path, config=None):
+        with tf.gfile.GFile(graph_path, "rb") as f:
+            graph_def = tf.GraphDef()
+            graph_def.ParseFromString(f.read())
+        with tf.Graph().as_default() as graph:
+            tf.import_graph_def(graph_def, name="prefix")
+        self._nodes = {
+            'waveforms': graph.get_tensor_by_name('prefix/waveforms:0'),
+            'lengths': graph.get_tensor_by_name('prefix/lengths:0'),
+            'outputs': graph.get_tensor_by_name('prefix/outputs:0'),
+            'scores': graph.get_tensor_by_name('prefix/scores:0')
+        }
+        self._session = tf.Session(graph=graph, config=config)
+
+    def __call__(self, waveforms):
+        _nodes = self._nodes
+        lengths = np.array([len(waveform) for waveform in waveforms], dtype=np.int32)
+        batch = np.zeros((len(waveforms), max(lengths)), dtype=np.float32)
+        for idx, waveform in enumerate(waveforms):
+            batch[idx, :lengths[idx]] = waveform
+        outputs, scores = self._session.run([_nodes['outputs'], _nodes['scores']], feed_dict={
+            _nodes['waveforms']: batch,
+            _nodes['lengths']: lengths
+        })
+        return {'outputs': outputs, 'scores': scores}
+
+    def close(self):
+        self._session.close()
+
 
 class Model():
     """ASR Model
-    Two propoerties/methods are exposed:
+    Four propoerties/methods are exposed:
     1) pred_fn: converts a waveform to a list of ids
     2) output_fn: converts list of ids to text
+    3) output_batch_fn: converts a batch of lists of ids to a list of texts
+    4) waveform_fn: same as pred_fn, but takes a list of float32 waveforms directly
+       instead of serialized tf.train.Example protos (None if the model directory has no
+       waveform.graph.pb, see WaveformGraph)
     """
 
-    def __init__(self, name):
+    def __init__(self, name, direct_input=True, threads=None):
         self.name = name
+        # tf.ConfigProto of every session, see at16k.core.threads.ThreadConfig.
+        self._config = session_config(threads)
         self._pred_fn = self._build_pred_fn()
-        self._output_fn = self._build_output_fn()
+        self._vocab_model = self._build_vocab_model()
+        self._output_fn = self._vocab_model.decode
+        self._waveform_fn = self._build_waveform_fn() if direct_input else None
 
     @property
     def pred_fn(self):
@@ -35,6 +153,27 @@ class Model():
         """
         return self._output_fn
 
+    @property
+    def output_batch_fn(self):
+        """
+        Converts a batch of lists of ids to a list of texts
+        """
+        return self._vocab_model.decode_batch
+
+    @property
+    def waveform_fn(self):
+        """
+        Converts a list of waveforms to list of ids, without tf.train.Example serialization
+        """
+        return self._waveform_fn
+
+    def close(self):
+        """
+        Release the TensorFlow sessions held by the model
+        """
+        self._pred_fn.session.close()
+        self.disable_waveform_fn()
+
     @staticmethod
     def _get_model_dir(name):
         if 'AT16K_RESOURCES_DIR' in os.environ:
@@ -49,16 +188,27 @@ class Model():
     def _build_pred_fn(self):
         name = self.name
         model_dir = self._get_model_dir(name)
-        model_path = os.path.join(model_dir, 'export')
-        sub_dirs = os.listdir(model_path)
-        sub_dirs.sort()
-        latest_model_path = os.path.join(model_path, sub_dirs[-1])
-        pred_fn = tf.contrib.predictor.from_saved_model(latest_model_path)
+        pred_fn = tf.contrib.predictor.from_saved_model(_latest_export(model_dir), config=self._config)
         return pred_fn
 
-    def _build_output_fn(self):
+    def _build_vocab_model(self):
         name = self.name
         model_dir = self._get_model_dir(name)
         model_path = os.path.join(model_dir, 'vocab', 'bpe.1000.t2t')
         vocab_model = SubwordTextEncoder(filename=model_path)
-        return vocab_model.decode
+        return vocab_model
+
+    def _build_waveform_fn(self):
+        model_dir = self._get_model_dir(self.name)
+        graph_path = os.path.join(model_dir, WAVEFORM_GRAPH)
+        if not os.path.exists(graph_path):
+            return None
+        return WaveformGraph(graph_path, config=self._config)
+
+    def disable_waveform_fn(self):
+        """
+        Stop using waveform_fn, e.g. after the graph rejected an input
+        """
+        if self._waveform_fn is not None:
+            self._waveform_fn.close()
+            self._waveform_fn = None
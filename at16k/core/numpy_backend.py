@@ -0,0 +1,241 @@
+"""
+Numpy implementations of the small RNN-T networks (text encoder and joint network)
+"""
+
+import numpy as np
+from at16k.utils.lazy_import import LazyModule
+
+tf = LazyModule('tensorflow')
+
+
+class UnsupportedGraph(ValueError):
+    """
+    Raised when a frozen graph cannot be run by the numpy backend
+    """
+
+
+def _sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+def _softmax(x):
+    x = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return x / np.sum(x, axis=-1, keepdims=True)
+
+
+def _log_softmax(x):
+    x = x - np.max(x, axis=-1, keepdims=True)
+    return x - np.log(np.sum(np.exp(x), axis=-1, keepdims=True))
+
+
+def _reduce(fn):
+    def _op(node, x, axis):
+        axis = tuple(np.atleast_1d(axis).tolist())
+        return fn(x, axis=axis, keepdims=node.attr['keep_dims'].b)
+    return _op
+
+
+def _strided_slice(node, x, begin, end, strides):
+    attr = node.attr
+    if attr['ellipsis_mask'].i or attr['new_axis_mask'].i:
+        raise UnsupportedGraph('StridedSlice with ellipsis or new axis masks')
+    index = []
+    for dim, (_begin, _end, _stride) in enumerate(zip(begin, end, strides)):
+        if attr['shrink_axis_mask'].i & (1 << dim):
+            index.append(int(_begin))
+            continue
+        index.append(slice(None if attr['begin_mask'].i & (1 << dim) else int(_begin),
+                           None if attr['end_mask'].i & (1 << dim) else int(_end),
+                           int(_stride)))
+    return x[tuple(index)]
+
+
+def _matmul(node, a, b):
+    if node.attr['transpose_a'].b:
+        a = a.T
+    if node.attr['transpose_b'].b:
+        b = b.T
+    return a @ b
+
+
+def _batch_matmul(node, a, b):
+    if node.attr['adj_x'].b:
+        a = np.swapaxes(a, -1, -2)
+    if node.attr['adj_y'].b:
+        b = np.swapaxes(b, -1, -2)
+    return a @ b
+
+
+def _split(node, axis, x):
+    return tuple(np.split(x, node.attr['num_split'].i, axis=int(axis)))
+
+
+def _cast(node, x):
+    return x.astype(tf.as_dtype(node.attr['DstT'].type).as_numpy_dtype)
+
+
+def _squeeze(node, x):
+    axis = tuple(node.attr['squeeze_dims'].list.i)
+    return np.squeeze(x, axis=axis or None)
+
+
+# Op type -> function(node, *inputs). Ops with several outputs return a tuple.
+_OPS = {
+    'Identity': lambda node, x: x,
+    'Snapshot': lambda node, x: x,
+    'StopGradient': lambda node, x: x,
+    'MatMul': _matmul,
+    'BatchMatMul': _batch_matmul,
+    'BatchMatMulV2': _batch_matmul,
+    'BiasAdd': lambda node, x, b: x + b,
+    'Add': lambda node, a, b: a + b,
+    'AddV2': lambda node, a, b: a + b,
+    'Sub': lambda node, a, b: a - b,
+    'Mul': lambda node, a, b: a * b,
+    'RealDiv': lambda node, a, b: a / b,
+    'Maximum': lambda node, a, b: np.maximum(a, b),
+    'Minimum': lambda node, a, b: np.minimum(a, b),
+    'Neg': lambda node, x: -x,
+    'Tanh': lambda node, x: np.tanh(x),
+    'Sigmoid': lambda node, x: _sigmoid(x),
+    'Relu': lambda node, x: np.maximum(x, 0),
+    'Exp': lambda node, x: np.exp(x),
+    'Log': lambda node, x: np.log(x),
+    'Square': lambda node, x: np.square(x),
+    'Sqrt': lambda node, x: np.sqrt(x),
+    'Rsqrt': lambda node, x: 1. / np.sqrt(x),
+    'Softmax': lambda node, x: _softmax(x),
+    'LogSoftmax': lambda node, x: _log_softmax(x),
+    'Max': _reduce(np.max),
+    'Sum': _reduce(np.sum),
+    'Mean': _reduce(np.mean),
+    'Reshape': lambda node, x, shape: np.reshape(x, shape),
+    'ExpandDims': lambda node, x, axis: np.expand_dims(x, int(axis)),
+    'Squeeze': _squeeze,
+    'Transpose': lambda node, x, perm: np.transpose(x, perm),
+    'ConcatV2': lambda node, *inputs: np.concatenate(inputs[:-1], axis=int(inputs[-1])),
+    'Pack': lambda node, *inputs: np.stack(inputs, axis=node.attr['axis'].i),
+    'Unpack': lambda node, x: tuple(np.moveaxis(x, node.attr['axis'].i, 0)),
+    'Split': _split,
+    'Tile': lambda node, x, multiples: np.tile(x, multiples),
+    'Shape': lambda node, x: np.array(x.shape, dtype=np.int32),
+    'Cast': _cast,
+    'StridedSlice': _strided_slice,
+    'GatherV2': lambda node, params, indices, axis: np.take(params, indices, axis=int(axis)),
+    'Fill': lambda node, shape, value: np.full(shape, value),
+    'ZerosLike': lambda node, x: np.zeros_like(x),
+    'OnesLike': lambda node, x: np.ones_like(x),
+}
+
+
+def _split_tensor_name(name):
+    if ':' in name:
+        node, index = name.rsplit(':', 1)
+        return node, int(index)
+    return name, 0
+
+
+class NumpyGraph:
+    """
+    Runs a straight-line frozen graph (no control flow) with numpy.
+    Constants are decoded once at construction; TensorFlow is only needed for that step.
+    Raises UnsupportedGraph if the graph needs an op that has no numpy implementation.
+    """
+
+    def __init__(self, graph_def, inputs, outputs):
+        self._nodes = {node.name: node for node in graph_def.node}
+        self._inputs = [_split_tensor_name(name) for name in inputs]
+        self._outputs = [_split_tensor_name(name) for name in outputs]
+        self._consts = {}
+        self._order = []
+        self._visit([node for node, _ in self._outputs], set(node for node, _ in self._inputs))
+
+    def _visit(self, names, feeds):
+        # Iterative post-order walk, so that deep graphs do not hit the recursion limit.
+        seen = set()
+        stack = [(name, False) for name in reversed(names)]
+        while stack:
+            name, expanded = stack.pop()
+            if expanded:
+                self._order.append(self._nodes[name])
+                continue
+            if name in seen or name in feeds:
+                continue
+            seen.add(name)
+            if name not in self._nodes:
+                raise UnsupportedGraph('Unknown node %s' % name)
+            node = self._nodes[name]
+            if node.op == 'Const':
+                self._consts[(name, 0)] = tf.make_ndarray(node.attr['value'].tensor)
+                continue
+            if node.op not in _OPS:
+                raise UnsupportedGraph('Unsupported op %s (%s)' % (node.op, name))
+            stack.append((name, True))
+            for source in node.input:
+                if not source.startswith('^'):
+                    stack.append((_split_tensor_name(source)[0], False))
+
+    def __call__(self, *inputs):
+        values = dict(self._consts)
+        for key, value in zip(self._inputs, inputs):
+            values[key] = np.asarray(value)
+        for node in self._order:
+            args = [values[_split_tensor_name(source)] for source in node.input if not source.startswith('^')]
+            result = _OPS[node.op](node, *args)
+            if isinstance(result, tuple):
+                for index, value in enumerate(result):
+                    values[(node.name, index)] = value
+            else:
+                values[(node.name, 0)] = result
+        return [values[key] for key in self._outputs]
+
+
+class NumpyTextEncoder:
+    """
+    Embedding lookup followed by a stack of LSTM cells, run for a single step.
+    States follow the LiveInferrer layout: (layers, 2, batch, units), with c before h.
+    """
+
+    def __init__(self, embedding, kernels, biases, forget_bias=1.0):
+        self._embedding = embedding
+        self._kernels = kernels
+        self._biases = biases
+        self._forget_bias = forget_bias
+
+    @classmethod
+    def from_graph_def(cls, graph_def, params, forget_bias=1.0):
+        """
+        Extract the embedding matrix and the LSTM kernels and biases from a frozen text encoder graph.
+        The LSTM layers are the kernels of shape [inputs + units, 4 * units], in node name order.
+        """
+        units = params['text_encoder_units']
+        consts = {node.name: tf.make_ndarray(node.attr['value'].tensor)
+                  for node in graph_def.node if node.op == 'Const'}
+        embeddings = [value for name, value in consts.items() if 'embedding' in name.lower() and value.ndim == 2]
+        kernels = sorted(name for name, value in consts.items()
+                         if name.endswith('kernel') and value.ndim == 2 and value.shape[1] == 4 * units)
+        if len(embeddings) != 1 or len(kernels) != params['text_encoder_layers']:
+            raise UnsupportedGraph('Cannot find the embedding and %d LSTM layers' % params['text_encoder_layers'])
+        biases = []
+        for name in kernels:
+            bias = consts.get(name[:-len('kernel')] + 'bias')
+            if bias is None or bias.shape != (4 * units,):
+                raise UnsupportedGraph('Cannot find the bias of %s' % name)
+            biases.append(bias)
+        return cls(embeddings[0], [consts[name] for name in kernels], biases, forget_bias)
+
+    def __call__(self, inputs, inputs_lengths, inputs_states=None):
+        tokens = np.asarray(inputs)[:, -1]
+        units = self._biases[0].shape[0] // 4
+        if inputs_states is None:
+            inputs_states = np.zeros((len(self._kernels), 2, len(tokens), units), dtype=np.float32)
+        x = self._embedding[tokens]
+        states = []
+        for layer, (kernel, bias) in enumerate(zip(self._kernels, self._biases)):
+            c, h = inputs_states[layer, 0], inputs_states[layer, 1]
+            i, j, f, o = np.split(np.concatenate([x, h], axis=1) @ kernel + bias, 4, axis=1)
+            c = c * _sigmoid(f + self._forget_bias) + _sigmoid(i) * np.tanh(j)
+            h = _sigmoid(o) * np.tanh(c)
+            states.append(np.stack([c, h]))
+            x = h
+        return x[:, np.newaxis, :].astype(np.float32), np.stack(states).astype(np.float32)
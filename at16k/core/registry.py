@@ -0,0 +1,178 @@
+"""
+Process-wide registry of loaded models
+"""
+
+import collections
+import os
+import threading
+
+from at16k.core.model import Model
+from at16k.core.live_model import LiveModel
+
+
+def _directory_size(path):
+    """
+    Total size of the files under path (in bytes), used as an estimate of the model's memory footprint
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total
+
+
+class _Entry:
+    """
+    Registry entry: a model (None while it is loading) and its reference count
+    """
+
+    def __init__(self):
+        self.model = None
+        self.size = 0
+        self.refs = 0
+        self.error = None
+        self.ready = threading.Event()
+
+
+class ModelRegistry:
+    """
+    Hands out shared, already-loaded models by name.
+    Every acquire() must be matched by a release(). Models that are no longer
+    referenced stay loaded until the memory budget (in bytes) is exceeded, at
+    which point the least recently used ones are unloaded.
+    """
+
+    def __init__(self, memory_budget=None):
+        self._memory_budget = memory_budget
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _make_key(name, live, kwargs):
+        return ('live' if live else 'offline', name, tuple(sorted(kwargs.items())))
+
+    @staticmethod
+    def _load(name, live, kwargs):
+        if live:
+            model = LiveModel(name, **kwargs)
+            model_dir = LiveModel._get_model_dir(name)
+        else:
+            model = Model(name, **kwargs)
+            model_dir = Model._get_model_dir(name)
+        return model, _directory_size(model_dir)
+
+    @staticmethod
+    def _unload(entry):
+        close = getattr(entry.model, 'close', None)
+        if close is not None:
+            close()
+
+    def _evict(self):
+        if self._memory_budget is None:
+            return
+        used = sum(entry.size for entry in self._entries.values())
+        for key in list(self._entries):
+            if used <= self._memory_budget:
+                break
+            entry = self._entries[key]
+            if entry.refs > 0 or not entry.ready.is_set():
+                continue
+            del self._entries[key]
+            self._unload(entry)
+            used -= entry.size
+
+    @property
+    def memory_budget(self):
+        """
+        Memory budget (in bytes); None means unlimited
+        """
+        return self._memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, value):
+        with self._lock:
+            self._memory_budget = value
+            self._evict()
+
+    @property
+    def memory_used(self):
+        """
+        Estimated memory held by loaded models (in bytes)
+        """
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def loaded(self):
+        """
+        List of (kind, name, kwargs, refs) for every loaded model, least recently used first
+        """
+        with self._lock:
+            return [key + (entry.refs,) for key, entry in self._entries.items()]
+
+    def acquire(self, name, live=False, **kwargs):
+        """
+        Get a shared model instance, loading it if needed.
+        kwargs are passed to Model/LiveModel; each distinct combination is a separate instance.
+        Models are loaded outside the registry lock: other models can be acquired and
+        released meanwhile, and concurrent requests for the same model wait for one load.
+        """
+        key = self._make_key(name, live, kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            is_loader = entry is None
+            if is_loader:
+                entry = _Entry()
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry.refs += 1
+        if is_loader:
+            try:
+                model, size = self._load(name, live, kwargs)
+            except BaseException as error:
+                with self._lock:
+                    del self._entries[key]
+                entry.error = error
+                entry.ready.set()
+                raise
+            with self._lock:
+                entry.model = model
+                entry.size = size
+                entry.ready.set()
+                self._evict()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+        return entry.model
+
+    def release(self, model):
+        """
+        Drop a reference obtained with acquire()
+        """
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.model is model:
+                    assert entry.refs > 0, 'Model released more often than acquired'
+                    entry.refs -= 1
+                    break
+            self._evict()
+
+    def clear(self):
+        """
+        Unload every model that is not referenced
+        """
+        with self._lock:
+            for key in list(self._entries):
+                entry = self._entries[key]
+                if entry.refs == 0 and entry.ready.is_set():
+                    del self._entries[key]
+                    self._unload(entry)
+
+
+def _budget_from_env():
+    if 'AT16K_MEMORY_BUDGET_MB' in os.environ:
+        return int(float(os.environ['AT16K_MEMORY_BUDGET_MB']) * 1024 * 1024)
+    return None
+
+
+REGISTRY = ModelRegistry(memory_budget=_budget_from_env())
@@ -0,0 +1,84 @@
+"""
+TensorFlow threading and CPU affinity settings
+"""
+
+import collections
+import os
+from at16k.utils.lazy_import import LazyModule
+
+tf = LazyModule('tensorflow')
+
+# Name of the inter-op thread pool shared by every session of the process when shared_pool is set.
+SHARED_POOL_NAME = 'at16k_inter_op'
+
+
+class ThreadConfig(collections.namedtuple('ThreadConfig', ['intra_op', 'inter_op', 'shared_pool'])):
+    """
+    Thread settings of the TensorFlow sessions of a model
+        intra_op: threads used inside a single op (None: TensorFlow's default, one per core)
+        inter_op: threads running independent ops (None: TensorFlow's default, one per core)
+        shared_pool: run every session of the process on one inter-op pool instead of one pool each
+    """
+    __slots__ = ()
+
+    def __new__(cls, intra_op=None, inter_op=None, shared_pool=False):
+        return super().__new__(cls, intra_op, inter_op, shared_pool)
+
+
+def session_config(threads=None):
+    """
+    Return the tf.ConfigProto for a ThreadConfig, or None for TensorFlow's defaults
+    """
+    if threads is None or threads == ThreadConfig():
+        return None
+    config = tf.ConfigProto()
+    if threads.intra_op:
+        config.intra_op_parallelism_threads = threads.intra_op
+    if threads.shared_pool:
+        pool = config.session_inter_op_thread_pool.add()
+        pool.num_threads = threads.inter_op or 0
+        pool.global_name = SHARED_POOL_NAME
+    elif threads.inter_op:
+        config.inter_op_parallelism_threads = threads.inter_op
+    return config
+
+
+def parse_cpus(value):
+    """
+    Parse a CPU list such as '0-3,8,10-11' into a sorted list of CPU ids
+    """
+    cpus = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def split_cpus(cpus, num_workers):
+    """
+    Split a list of CPU ids into num_workers disjoint, contiguous sets (as even as possible)
+    """
+    assert len(cpus) >= num_workers, 'Need at least one CPU per worker'
+    size, extra = divmod(len(cpus), num_workers)
+    sets = []
+    start = 0
+    for idx in range(num_workers):
+        end = start + size + (1 if idx < extra else 0)
+        sets.append(cpus[start:end])
+        start = end
+    return sets
+
+
+def set_cpu_affinity(cpus):
+    """
+    Pin the current process to the given CPU ids (Linux only)
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        raise OSError('CPU affinity is not supported on this platform')
+    os.sched_setaffinity(0, cpus)
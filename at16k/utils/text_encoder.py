@@ -28,11 +28,13 @@ import collections
 from itertools import chain
 import re
 import time
+import numpy as np
 import six
 from six.moves import range  # pylint: disable=redefined-builtin
 from at16k.utils import tokenizer
+from at16k.utils.lazy_import import LazyModule
 
-import tensorflow as tf
+tf = LazyModule("tensorflow")
 
 # Reserved tokens for things like padding and EOS symbols.
 PAD = "<pad>"
@@ -311,6 +313,41 @@ class SubwordTextEncoder(TextEncoder):
         return unicode_to_native(
             tokenizer.decode(self._subtoken_ids_to_tokens(ids)))
 
+    def decode_batch(self, ids_list, strip_extraneous=False):
+        """Converts several sequences of subtoken ids to native strings.
+
+        Equivalent to [decode(ids, strip_extraneous) for ids in ids_list], with
+        the id to string lookup and reserved id stripping done with numpy.
+
+        Args:
+            ids_list: a list of integer arrays, e.g. a batch of model outputs
+            strip_extraneous: bool, whether to strip off trailing extraneous
+                tokens (EOS and PAD).
+
+        Returns:
+            a list of native strings
+        """
+        return [self._decode_fast(ids, strip_extraneous) for ids in ids_list]
+
+    def _decode_fast(self, ids, strip_extraneous):
+        """numpy implementation of decode() for a single sequence."""
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        if strip_extraneous and ids.size:
+            num_reserved = self._num_reserved_ids or 0
+            kept = np.flatnonzero((ids < 0) | (ids >= num_reserved))
+            ids = ids[:(kept[-1] + 1)] if kept.size else ids[:0]
+        ids = ids[(ids >= 0) & (ids < len(self._subtoken_strings_array))]
+        concatenated = "".join(self._subtoken_strings_array[ids].tolist())
+        tokens = []
+        for t in concatenated.split("_"):
+            if not t:
+                continue
+            # Only tokens containing a backslash carry escape sequences.
+            unescaped = _unescape_token(t + "_") if "\\" in t else t
+            if unescaped:
+                tokens.append(unescaped)
+        return unicode_to_native(tokenizer.decode(tokens))
+
     def decode_list(self, ids):
         return [self._subtoken_id_to_subtoken_string(s) for s in ids]
 
@@ -686,6 +723,8 @@ class SubwordTextEncoder(TextEncoder):
             s: i + len(reserved_tokens)
             for i, s in enumerate(subtoken_strings) if s
         }
+        # Id to string lookup table for decode_batch().
+        self._subtoken_strings_array = np.array(self._all_subtoken_strings, dtype=object)
         # Initialize the cache to empty.
         self._cache_size = 2 ** 20
         self._cache = [(None, None)] * self._cache_size
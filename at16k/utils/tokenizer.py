@@ -49,17 +49,37 @@ import sys
 import unicodedata
 import six
 from six.moves import range  # pylint: disable=redefined-builtin
-import tensorflow as tf
+from at16k.utils.lazy_import import LazyModule
+
+tf = LazyModule("tensorflow")
 
 # Conversion between Unicode and UTF-8, if required (on Python2)
 _native_to_unicode = (lambda s: s.decode(
     "utf-8")) if six.PY2 else (lambda s: s)
 
+
+class _AlphanumericCharSet(object):
+    """Set-like membership test for all letter and number characters.
+
+    Classifying every code point up front takes seconds, so characters are
+    classified on first lookup and the result is kept in a table.
+    """
+
+    def __init__(self):
+        self._table = {}
+
+    def __contains__(self, char):
+        try:
+            return self._table[char]
+        except KeyError:
+            is_alnum = (len(char) == 1 and ord(char) < sys.maxunicode and
+                        unicodedata.category(char)[0] in "LN")
+            self._table[char] = is_alnum
+            return is_alnum
+
+
 # This set contains all letter and number characters.
-_ALPHANUMERIC_CHAR_SET = set(
-    six.unichr(i) for i in range(sys.maxunicode)
-    if (unicodedata.category(six.unichr(i)).startswith("L") or
-        unicodedata.category(six.unichr(i)).startswith("N")))
+_ALPHANUMERIC_CHAR_SET = _AlphanumericCharSet()
 
 
 def encode(text):
@@ -0,0 +1,72 @@
+import json
+import pytest
+from at16k.bin import batch_runner
+
+
+class FakeSpeechToText:
+    """
+    Offline pipeline stub: fails on files listed in bad, stops the job after stop_after calls
+    """
+
+    def __init__(self, bad=(), stop_after=None):
+        self.bad = set(bad)
+        self.stop_after = stop_after
+        self.calls = []
+
+    def _transcribe(self, file_path):
+        if file_path in self.bad:
+            raise IOError('cannot read %s' % file_path)
+        return {'file': file_path, 'text': file_path.upper()}
+
+    def batch(self, file_paths, max_batch=16):
+        if self.stop_after is not None and len(self.calls) >= self.stop_after:
+            raise KeyboardInterrupt()
+        self.calls.append(list(file_paths))
+        return [self._transcribe(file_path) for file_path in file_paths]
+
+    def __call__(self, file_path):
+        return self._transcribe(file_path)
+
+
+def _use(monkeypatch, stt):
+    def init_worker(model, decode, live_options=None, threads=None, cpu_sets=None):
+        batch_runner._STT = stt
+        batch_runner._MODEL = model
+    monkeypatch.setattr(batch_runner, '_init_worker', init_worker)
+
+
+def _read(out_path):
+    items = []
+    with open(out_path, 'r') as f:
+        for line in f:
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                assert line.startswith('{"file": "e", "te')
+    return items
+
+
+def test_resume_after_kill(monkeypatch, tmpdir):
+    manifest_path = str(tmpdir.join('files.txt'))
+    out_path = str(tmpdir.join('results.jsonl'))
+    with open(manifest_path, 'w') as f:
+        f.write('a\nbad\n# comment\n\nc\nd\ne\n')
+
+    # First run: 'bad' fails and the job is killed before the last chunk.
+    _use(monkeypatch, FakeSpeechToText(bad=['bad'], stop_after=2))
+    with pytest.raises(KeyboardInterrupt):
+        batch_runner.run('en_8k', manifest_path, out_path, chunk_size=2)
+    # Simulate a torn write of the last line.
+    with open(out_path, 'a') as f:
+        f.write('{"file": "e", "te')
+    assert batch_runner.read_completed(out_path) == {'a', 'c', 'd'}
+
+    # Second run: completed files are skipped, the failed one is retried.
+    stt = FakeSpeechToText()
+    _use(monkeypatch, stt)
+    num_done, num_failed, num_skipped = batch_runner.run('en_8k', manifest_path, out_path, chunk_size=2)
+    assert (num_done, num_failed, num_skipped) == (2, 0, 3)
+    assert stt.calls == [['bad', 'e']]
+    items = _read(out_path)
+    assert [item['file'] for item in items if 'error' not in item] == ['a', 'c', 'd', 'bad', 'e']
+    assert batch_runner.read_completed(out_path) == {'a', 'bad', 'c', 'd', 'e'}
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import scipy.io.wavfile as wavfile
+from at16k.bench import runner
+
+
+class FakeOffline:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, file_path):
+        self.calls.append(file_path)
+        return {'text': 'hello'}
+
+
+class FakeLive:
+
+    def from_file(self, file_path):
+        for text in ['', '', 'he', 'hello']:
+            yield {'text': text}
+
+
+def test_synthesize_long_repeats_input(tmpdir):
+    path = os.path.join(str(tmpdir), 'short.wav')
+    data = np.arange(800, dtype=np.int16)
+    wavfile.write(path, 8000, data)
+    long_path = runner.synthesize_long(path, 1., str(tmpdir))
+    sample_rate, long_data = wavfile.read(long_path)
+    assert sample_rate == 8000 and len(long_data) == 8000
+    assert np.array_equal(long_data[800:1600], data)
+
+
+def test_measure_reports_real_time_factor():
+    stt = FakeOffline()
+    result = runner.measure_offline(stt, 'a.wav', 2., repeat=3)
+    assert len(stt.calls) == 3
+    assert result['rtf'] == result['elapsed'] / 2.
+
+    result = runner.measure_live(FakeLive(), 'a.wav', 2., repeat=2)
+    assert 0. <= result['first_partial'] <= result['elapsed']
+    assert runner.peak_rss_mb() > 0
+
+
+def test_inputs_are_required_without_samples(monkeypatch, tmpdir):
+    import pytest
+    monkeypatch.setattr(runner, 'SAMPLES_DIR', str(tmpdir.join('missing')))
+    monkeypatch.setattr('sys.argv', ['at16k-bench'])
+    with pytest.raises(SystemExit):
+        runner.main()
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+import pytest
+from at16k.core.live_inference import FUSED_GRAPH, GRAPHS, LiveInferrer, prepare_fused_graph
+
+PARAMS = {
+    'audio_encoder_layers': 1,
+    'audio_encoder_units': 4,
+    'text_encoder_layers': 1,
+    'text_encoder_units': 4
+}
+
+
+def write_graphs(tf, model_dir):
+    tf_v1 = tf.compat.v1
+
+    def write(name, build):
+        with tf.Graph().as_default() as graph:
+            build()
+        with open(os.path.join(model_dir, name), 'wb') as f:
+            f.write(graph.as_graph_def().SerializeToString())
+
+    def features():
+        samples = tf_v1.placeholder(tf.float32, [None], name='samples')
+        tf.reshape(samples, [1, -1, 2, 1], name='feats')
+
+    def deltas():
+        raw_feats = tf_v1.placeholder(tf.float32, [1, None, 2, 1], name='raw_feats')
+        tf.concat([raw_feats, raw_feats * 2.], axis=3, name='delta_feats')
+
+    def audio_encoder():
+        with tf.name_scope('audio_encoder'):
+            inputs = tf_v1.placeholder(tf.float32, [None, None, 2, 2], name='a_inputs')
+            states = tf_v1.placeholder(tf.float64, [1, 2, None, 4], name='a_inputs_states')
+            tf.tile(tf.reduce_sum(inputs, axis=[1, 2]), [1, 2], name='a_outputs')
+            tf.identity(states + 1., name='a_states')
+
+    def text_encoder():
+        with tf.name_scope('text_encoder'):
+            inputs = tf_v1.placeholder(tf.int32, [None, None], name='t_inputs')
+            tf_v1.placeholder(tf.int32, [None], name='t_inputs_lengths')
+            states = tf_v1.placeholder(tf.float64, [1, 2, None, 4], name='t_inputs_states')
+            tf.cast(tf.tile(inputs, [1, 4]), tf.float32, name='t_outputs')
+            tf.identity(states, name='t_states')
+
+    def joint_encoder():
+        with tf.name_scope('rnnt_logits'):
+            a_logits = tf_v1.placeholder(tf.float32, [None, 4], name='a_logits')
+            t_logits = tf_v1.placeholder(tf.float32, [None, 4], name='t_logits')
+        logits = tf.identity(a_logits + t_logits, name='joint_logits')
+        tf.nn.log_softmax(logits, name='joint_log_probs')
+
+    write('audio_features.graph.pb', features)
+    write('delta_features.graph.pb', deltas)
+    write('audio_encoder.graph.pb', audio_encoder)
+    write('text_encoder.graph.pb', text_encoder)
+    write('joint_encoder.graph.pb', joint_encoder)
+
+
+def run_inferrer(inferrer):
+    history, deltas = inferrer.infer_feature_deltas(np.arange(6, dtype=np.float32))
+    feats, deltas = inferrer.infer_feature_deltas(np.arange(4, dtype=np.float32), history)
+    a_out, _ = inferrer.infer_audio_encoder(deltas[:, :2])
+    logits, _ = inferrer.infer_joint_encoder(a_out, inferrer.infer_text_encoder([[1]], [1])[0])
+    inferrer.close()
+    return [feats, deltas, logits]
+
+
+def test_fused_graph_matches_separate_sessions(tmpdir):
+    tf = pytest.importorskip('tensorflow')
+    model_dir = str(tmpdir)
+    write_graphs(tf, model_dir)
+    expected = run_inferrer(LiveInferrer(PARAMS, model_dir))
+    assert expected[0].shape == (1, 5, 2, 1)
+    assert np.allclose(expected[1][..., 1], 2 * expected[0][..., 0])
+
+    results = [run_inferrer(LiveInferrer(PARAMS, model_dir, fused=True))]
+    prepare_fused_graph(model_dir)
+    assert os.path.exists(os.path.join(model_dir, FUSED_GRAPH))
+    results.append(run_inferrer(LiveInferrer(PARAMS, model_dir, fused=True)))
+    for outputs in results:
+        for output, value in zip(outputs, expected):
+            assert np.allclose(output, value)
+
+
+def test_fused_option_selects_the_session_loader(monkeypatch):
+    monkeypatch.setattr(LiveInferrer, '_make_sessions', lambda self, model_dir: ('separate', {}))
+    monkeypatch.setattr(LiveInferrer, '_make_fused_session', lambda self, model_dir: ('fused', {}))
+    assert LiveInferrer(PARAMS, 'model_dir')._sessions == 'separate'
+    assert LiveInferrer(PARAMS, 'model_dir', fused=True)._sessions == 'fused'
+
+
+def test_metrics_time_each_network(monkeypatch):
+    from types import SimpleNamespace
+    from at16k.core.metrics import Metrics
+    session = SimpleNamespace(run=lambda fetches, feed_dict: [np.zeros(1), np.zeros(1)])
+    nodes = {key: {name: name for name in names} for key, (_, names) in GRAPHS.items()}
+    monkeypatch.setattr(LiveInferrer, '_make_sessions', lambda self, model_dir: (
+        {key: session for key in GRAPHS}, nodes))
+    metrics = Metrics()
+    inferrer = LiveInferrer(PARAMS, 'model_dir', metrics=metrics)
+    inferrer.infer_audio_encoder(np.zeros((1, 2, 2, 2)))
+    inferrer.infer_text_encoder([[1]], [1])
+    inferrer.infer_joint_encoder(np.zeros((1, 4)), np.zeros((1, 4)))
+    inferrer.infer_joint_encoder(np.zeros((1, 4)), np.zeros((1, 4)))
+    counts = {key: value['count'] for key, value in metrics.snapshot()['networks'].items()}
+    assert counts == {'a': 1, 't': 1, 'j': 2}
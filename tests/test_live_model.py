@@ -0,0 +1,365 @@
+import threading
+import numpy as np
+import pytest
+from at16k.core.live_model import EndpointConfig, LiveModel, Prefix
+from at16k.core.live_scheduler import LiveScheduler
+
+PARAMS = {
+    'vocab_null_id': 0,
+    'vocab_eos_id': 1,
+    'audio_encoder_layers': 1,
+    'audio_encoder_units': 6,
+    'text_encoder_layers': 1,
+    'text_encoder_units': 6
+}
+VOCAB_SIZE = 12
+FRAME_SIZE = 160
+
+
+class FakeInferrer:
+    """
+    Small deterministic numpy networks with the same interface and tensor layout as LiveInferrer
+    """
+
+    def __init__(self, seed=0, batch_size=None):
+        # batch_size=1 mimics graphs exported with a fixed batch dimension.
+        self._batch_size = batch_size
+        random = np.random.RandomState(seed)
+        units = PARAMS['audio_encoder_units']
+        self._feats_kernel = random.randn(FRAME_SIZE, 4)
+        self._audio_kernel = random.randn(15 * 4 * 2, units) * 0.3
+        self._audio_recurrent = random.randn(units, units) * 0.3
+        self._embedding = random.randn(VOCAB_SIZE, units)
+        self._text_recurrent = random.randn(units, units) * 0.3
+        self._joint_kernel = random.randn(units, VOCAB_SIZE)
+        # Favour the null symbol so that only a few symbols are emitted per frame.
+        self._joint_bias = np.zeros(VOCAB_SIZE)
+        self._joint_bias[PARAMS['vocab_null_id']] = 2.5
+        self._joint_bias[PARAMS['vocab_eos_id']] = -10.
+
+    def infer_features(self, inputs):
+        inputs = np.asarray(inputs, dtype=np.float32)
+        num_frames = len(inputs) // FRAME_SIZE
+        frames = np.reshape(inputs[:num_frames * FRAME_SIZE], (num_frames, FRAME_SIZE))
+        return np.tanh(frames @ self._feats_kernel)[np.newaxis, :, :, np.newaxis]
+
+    def infer_delta_features(self, inputs):
+        padded = np.concatenate([inputs[:, :1], inputs, inputs[:, -1:]], axis=1)
+        deltas = padded[:, 2:] - padded[:, :-2]
+        return np.concatenate([inputs, deltas], axis=3)
+
+    def infer_feature_deltas(self, inputs, feats_history=None):
+        feats = self.infer_features(inputs)
+        if feats_history is not None:
+            feats = np.concatenate([feats_history, feats], axis=1)
+        return feats, self.infer_delta_features(feats)
+
+    def _check_batch(self, batch):
+        if self._batch_size is not None and batch != self._batch_size:
+            raise ValueError('Cannot feed a batch of %d' % batch)
+
+    def infer_audio_encoder(self, inputs, inputs_states=None):
+        batch = inputs.shape[0]
+        self._check_batch(batch)
+        hidden = np.tanh(np.reshape(inputs, (batch, -1)) @ self._audio_kernel +
+                         inputs_states[0, 1] @ self._audio_recurrent)
+        states = np.stack([hidden, hidden])[np.newaxis]
+        return hidden[:, np.newaxis, :], states
+
+    def infer_text_encoder(self, inputs, inputs_lengths, inputs_states=None):
+        if inputs_states is None:
+            inputs_states = np.zeros((1, 2, len(inputs), PARAMS['text_encoder_units']))
+        tokens = np.asarray(inputs)[:, -1]
+        self._check_batch(len(tokens))
+        hidden = np.tanh(self._embedding[tokens] + inputs_states[0, 1] @ self._text_recurrent)
+        states = np.stack([hidden, hidden])[np.newaxis]
+        return hidden[:, np.newaxis, :], states
+
+    def infer_joint_encoder(self, a_inputs, t_inputs):
+        logits = np.tanh(a_inputs + t_inputs) @ self._joint_kernel + self._joint_bias
+        logits = logits - np.max(logits, axis=-1, keepdims=True)
+        probs = logits - np.log(np.sum(np.exp(logits), axis=-1, keepdims=True))
+        return logits[:, :, np.newaxis, :], probs[:, :, np.newaxis, :]
+
+
+class FakeVocab:
+    def DecodeIds(self, ids):
+        return ' '.join(str(i) for i in ids)
+
+
+def make_model(faster=True, beams=4, batch_size=None, batched_beam=False, text_cache_size=256, endpoint=None,
+               metrics=None):
+    model = LiveModel.__new__(LiveModel)
+    model.name = 'fake'
+    model._faster = faster
+    model._num_beams = beams
+    model._batched_beam = batched_beam
+    model._text_cache_size = text_cache_size
+    model._max_symbols_per_step = 10
+    model._delta_context = 8
+    model._sample_rate = 16000
+    model._endpoint = endpoint
+    model._metrics = metrics
+    model._batching = None
+    model._filter_non_speech = False
+    model._inferrer = FakeInferrer(batch_size=batch_size)
+    model._params = PARAMS
+    model._vocab = FakeVocab()
+    return model
+
+
+def make_streams(num_streams, num_chunks, chunk_size=1600):
+    random = np.random.RandomState(1)
+    return [[random.randn(chunk_size).astype(np.float32) for _ in range(num_chunks)] for _ in range(num_streams)]
+
+
+def decode(model, chunks):
+    context = None
+    texts = []
+    for chunk in chunks:
+        text, context = model(chunk, context)
+        texts.append(text)
+    return texts
+
+
+def test_greedy_emits_symbols():
+    texts = decode(make_model(), make_streams(1, 6)[0])
+    assert texts[-1]
+
+
+def _check_batch_call(model):
+    streams = make_streams(4, 5)
+    expected = [decode(make_model(faster=model._faster), chunks) for chunks in streams]
+    contexts = None
+    for step in range(5):
+        texts, contexts = model.batch_call([chunks[step] for chunks in streams], contexts)
+        assert texts == [item[step] for item in expected]
+
+
+def test_batch_call_matches_single_stream():
+    model = make_model()
+    _check_batch_call(model)
+    assert model._batching
+
+
+def test_batch_call_batches_beam_search_across_streams():
+    sequential = make_model(faster=False)
+    sequential._inferrer = CountingInferrer()
+    for chunks in make_streams(4, 5):
+        decode(sequential, chunks)
+    for batched_beam in (False, True):
+        model = make_model(faster=False, batched_beam=batched_beam)
+        model._inferrer = CountingInferrer()
+        _check_batch_call(model)
+        # Each joint run covers the hypotheses of all streams still searching.
+        assert model._inferrer.calls['j'] < sequential._inferrer.calls['j'] / 2
+
+
+def test_batch_call_without_batch_support():
+    model = make_model(batch_size=1)
+    _check_batch_call(model)
+    assert model._batching is False
+
+
+def test_scheduler_batches_concurrent_streams():
+    model = make_model()
+    streams = make_streams(6, 5)
+    expected = [decode(make_model(), chunks) for chunks in streams]
+    batch_sizes = []
+    batch_call = model.batch_call
+
+    def counting_batch_call(samples_list, contexts):
+        batch_sizes.append(len(samples_list))
+        return batch_call(samples_list, contexts)
+
+    model.batch_call = counting_batch_call
+    scheduler = LiveScheduler(model, max_batch=4, max_wait=0.05)
+    results = [[] for _ in streams]
+
+    def run(index):
+        context = None
+        for chunk in streams[index]:
+            text, context = scheduler(chunk, context)
+            results[index].append(text)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(streams))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+    assert results == expected
+    assert max(batch_sizes) > 1
+    assert max(batch_sizes) <= 4
+
+
+class CountingInferrer(FakeInferrer):
+    def __init__(self):
+        super().__init__()
+        self.calls = {'a': 0, 't': 0, 'j': 0}
+
+    def infer_audio_encoder(self, inputs, inputs_states=None):
+        self.calls['a'] += 1
+        return super().infer_audio_encoder(inputs, inputs_states)
+
+    def infer_text_encoder(self, inputs, inputs_lengths, inputs_states=None):
+        self.calls['t'] += 1
+        return super().infer_text_encoder(inputs, inputs_lengths, inputs_states)
+
+    def infer_joint_encoder(self, a_inputs, t_inputs):
+        self.calls['j'] += 1
+        return super().infer_joint_encoder(a_inputs, t_inputs)
+
+
+def decode_candidates(model, chunks):
+    context = None
+    for chunk in chunks:
+        text, context = model(chunk, context)
+    return text, [(candidate.prefix.tokens(), candidate.log_prob) for candidate in context['candidates']]
+
+
+def test_beam_search_modes():
+    for seed in range(3):
+        random = np.random.RandomState(seed)
+        chunks = [random.randn(1600).astype(np.float32) for _ in range(8)]
+        sequential = make_model(faster=False)
+        sequential._inferrer = CountingInferrer()
+        batched = make_model(faster=False, batched_beam=True)
+        batched._inferrer = CountingInferrer()
+        text, candidates = decode_candidates(sequential, chunks)
+        batched_text, batched_candidates = decode_candidates(batched, chunks)
+        assert text and batched_text == text
+        assert [tokens for tokens, _ in batched_candidates] == [tokens for tokens, _ in candidates]
+        assert np.allclose([score for _, score in batched_candidates], [score for _, score in candidates])
+        # The same expansions, with fewer network runs.
+        assert batched._inferrer.calls['j'] < sequential._inferrer.calls['j']
+
+
+def test_batched_beam_search_falls_back_on_fixed_batch():
+    chunks = make_streams(1, 6)[0]
+    fixed = make_model(faster=False, batched_beam=True, batch_size=1)
+    assert decode_candidates(fixed, chunks)[0] == decode_candidates(make_model(faster=False), chunks)[0]
+    assert fixed._batching is False
+    texts, _ = fixed.batch_call([chunks[0]])
+    assert len(texts) == 1
+
+
+def test_text_cache():
+    chunks = make_streams(1, 6)[0]
+    for batched_beam in (False, True):
+        uncached = make_model(faster=False, batched_beam=batched_beam, text_cache_size=0)
+        uncached._inferrer = CountingInferrer()
+        cached = make_model(faster=False, batched_beam=batched_beam)
+        cached._inferrer = CountingInferrer()
+        assert decode(cached, chunks) == decode(uncached, chunks)
+        assert cached._inferrer.calls['t'] < uncached._inferrer.calls['t']
+
+        context = None
+        for chunk in chunks:
+            _, context = cached(chunk, context)
+        cache = context['text_cache']
+        assert cache.hits > 0
+        assert len(cache) <= len(context['candidates'])
+
+
+def test_prefix_shares_history():
+    root = Prefix(0)
+    left = root.extend(3).extend(5)
+    right = root.extend(3).extend(5)
+    assert left == right and hash(left) == hash(right)
+    assert left != root.extend(5).extend(3)
+    assert left.parent.parent is root
+    assert left.tokens() == [0, 3, 5] and len(left) == 3
+    assert {left: 1}[right] == 1
+
+
+def test_delta_context_is_measured():
+    # The fake delta network reads one frame on either side.
+    assert make_model()._measure_delta_context() == 1
+
+
+def test_feature_history_is_bounded():
+    chunks = make_streams(1, 40, chunk_size=800)[0]
+    full_history = make_model()
+    full_history._delta_context = 10 ** 9
+    model = make_model()
+    model._delta_context = model._measure_delta_context()
+    assert decode(model, chunks) == decode(full_history, chunks)
+
+    # Trimming leaves the windows fed to the audio encoder unchanged.
+    contexts = [full_history._reset_context(), model._reset_context()]
+    for chunk in chunks:
+        expected = full_history._extract_windows(chunk, contexts[0])
+        windows = model._extract_windows(chunk, contexts[1])
+        assert len(windows) == len(expected)
+        for window, expected_window in zip(windows, expected):
+            np.testing.assert_allclose(window, expected_window)
+
+    context = None
+    for chunk in chunks:
+        _, context = model(chunk, context)
+        pending = context['feats_offset'] + context['feats_so_far'].shape[1] - context['last_frame_processed']
+        assert context['feats_so_far'].shape[1] <= pending + model._delta_context
+    assert context['feats_offset'] > 0
+
+
+def test_save_and_load_context():
+    chunks = make_streams(1, 8)[0]
+    for faster in (True, False):
+        model = make_model(faster=faster)
+        expected = decode(model, chunks)
+        context = None
+        for chunk in chunks[:4]:
+            _, context = model(chunk, context)
+        data = model.save_context(context)
+        assert len(model.save_context(context, float16=True)) < len(data)
+        texts = []
+        for chunk in chunks[4:]:
+            text, context = model(chunk, model.load_context(data))
+            data = model.save_context(context)
+            texts.append(text)
+        assert texts == expected[4:]
+
+
+def test_load_context_rejects_other_data():
+    model = make_model()
+    data = model.save_context(model._reset_context())
+    with pytest.raises(ValueError):
+        model.load_context(b'not a context')
+    with pytest.raises(ValueError):
+        model.load_context(data[:-8])
+
+
+def test_endpoint_on_silence():
+    speech = make_streams(1, 6)[0]
+    silence = [np.zeros(1600, dtype=np.float32)] * 6
+    for faster in (True, False):
+        model = make_model(faster=faster, endpoint=EndpointConfig(blank_windows=None, silence=0.5))
+        before = decode(model, speech)[-1]
+        context = None
+        for chunk in speech + silence:
+            text, context = model(chunk, context)
+        assert len(context['finals']) == 1
+        assert context['finals'][0].startswith(before)
+        assert text != context['finals'][0]
+
+
+def test_endpoint_on_blank_windows():
+    chunks = make_streams(1, 20)[0]
+    for faster in (True, False):
+        model = make_model(faster=faster, endpoint=EndpointConfig(blank_windows=2))
+        context = None
+        for chunk in chunks:
+            _, context = model(chunk, context)
+        assert context['finals'] and all(context['finals'])
+        _, contexts = model.batch_call([chunks[0]], [context])
+        assert contexts[0] is context
+
+
+def test_beam_search_records_expansions():
+    from at16k.core.metrics import Metrics
+    for batched_beam in (False, True):
+        metrics = Metrics()
+        decode(make_model(faster=False, batched_beam=batched_beam, metrics=metrics), make_streams(1, 4)[0])
+        expansions = metrics.snapshot()['beam_expansions']
+        assert expansions['count'] > 0 and expansions['sum'] >= expansions['count']
@@ -0,0 +1,164 @@
+import asyncio
+import json
+from at16k.api.live_server import LiveServer
+
+
+class FakeLiveSpeechToText:
+    """
+    Counts the samples received on each stream
+    """
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.buffer_sizes = []
+
+    def from_buffer(self, buffer, context, dtype='<i2', sample_rate=None):
+        self.buffer_sizes.append(len(buffer))
+        context = (context or 0) + len(buffer) // 2
+        if self.fail_after is not None and context > self.fail_after:
+            raise RuntimeError('decoder failed')
+        return str(context), context
+
+
+async def _transcribe(port, chunks, raw_body=b'', path='/transcribe?dtype=int16'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'POST %s HTTP/1.1\r\nHost: localhost\r\n' % path.encode('latin-1') +
+                 b'Transfer-Encoding: chunked\r\n\r\n')
+    for chunk in chunks:
+        writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        await writer.drain()
+    writer.write(raw_body or b'0\r\n\r\n')
+    response = await reader.read()
+    writer.close()
+    head, body = response.split(b'\r\n\r\n', 1)
+    events = []
+    while True:
+        size_line, body = body.split(b'\r\n', 1)
+        size = int(size_line, 16)
+        if size == 0:
+            break
+        events.append(json.loads(body[:size].decode('utf-8')))
+        body = body[(size + 2):]
+    return head, events
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _serve(stt, requests, path='/transcribe?dtype=int16', **kwargs):
+    async def run():
+        server = LiveServer(stt, **kwargs)
+        listener = await server.start('127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        results = await asyncio.gather(*[_transcribe(port, *request, path=path) for request in requests])
+        await server.close()
+        return results
+
+    return _run(run())
+
+
+def test_concurrent_streams():
+    # An odd-sized chunk checks that split samples are carried over.
+    streams = [([b'\x00' * 3, b'\x00' * (1000 * i + 1)],) for i in range(1, 6)]
+    results = _serve(FakeLiveSpeechToText(), streams, max_workers=2)
+    for i, (head, events) in enumerate(results, 1):
+        assert head.startswith(b'HTTP/1.1 200')
+        assert events[-1] == {'text': str(500 * i + 2), 'final': True}
+
+
+def test_decode_size_is_capped():
+    stt = FakeLiveSpeechToText()
+    results = _serve(stt, [([b'\x00' * 100000],)], max_decode_bytes=4000)
+    assert results[0][1][-1] == {'text': '50000', 'final': True}
+    assert max(stt.buffer_sizes) <= 4000
+
+
+def test_malformed_chunk_ends_with_error():
+    results = _serve(FakeLiveSpeechToText(), [([b'\x00' * 10], b'zz\r\n\r\n')])
+    assert results[0][1][-1] == {'error': 'Malformed chunk size'}
+
+
+def test_decoder_error_ends_with_error():
+    results = _serve(FakeLiveSpeechToText(fail_after=10), [([b'\x00' * 100],)])
+    assert results[0][1][-1] == {'error': "RuntimeError('decoder failed')"}
+
+
+def test_unknown_path():
+    async def run():
+        server = LiveServer(FakeLiveSpeechToText())
+        listener = await server.start('127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET / HTTP/1.1\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        await server.close()
+        return response
+
+    assert _run(run()).startswith(b'HTTP/1.1 404')
+
+
+class FakeEndpointingSpeechToText:
+    """
+    Ends an utterance every 100 samples
+    """
+
+    def from_buffer(self, buffer, context, dtype='<i2', sample_rate=None):
+        context = context or {'samples': 0, 'finals': []}
+        context['samples'] += len(buffer) // 2
+        while context['samples'] >= 100:
+            context['samples'] -= 100
+            context['finals'].append('100')
+        return str(context['samples']), context
+
+
+def test_endpoint_finals_are_streamed():
+    requests = [([b'\x00\x00' * 130, b'\x00\x00' * 90],)]
+    head, events = _serve(FakeEndpointingSpeechToText(), requests)[0]
+    finals = [event for event in events if event.get('final')]
+    assert finals == [{'text': '100', 'final': True}] * 2 + [{'text': '20', 'final': True}]
+
+
+def test_event_stream():
+    from at16k.api.live_speech_to_text import LiveSpeechToText
+
+    class CountingModel:
+        def __call__(self, samples, context=None):
+            context = context or {'samples': 0}
+            context['samples'] += len(samples)
+            return 'x' * (context['samples'] // 100), context
+
+    stt = LiveSpeechToText.__new__(LiveSpeechToText)
+    stt._model = CountingModel()
+    stt._scheduler = None
+    requests = [([b'\x00\x00' * 250, b'\x00\x00' * 100],)]
+    head, events = _serve(stt, requests, path='/transcribe?dtype=int16&events=1')[0]
+    assert all(event['type'] == 'partial' for event in events[:-1])
+    assert ''.join(event['tail'] for event in events[:-1]) == 'xxx'
+    assert events[-1] == {'type': 'final', 'seq': len(events) - 1, 'utterance': 0, 'text': 'xxx'}
+
+
+def test_metrics_endpoint():
+    from at16k.core.metrics import Metrics
+    metrics = Metrics()
+    metrics.observe_latency('a', 0.01)
+
+    async def run():
+        server = LiveServer(FakeLiveSpeechToText(), metrics=metrics)
+        listener = await server.start('127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /metrics HTTP/1.1\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        await server.close()
+        return response
+
+    head, body = _run(run()).split(b'\r\n\r\n', 1)
+    assert head.startswith(b'HTTP/1.1 200')
+    assert b'at16k_network_seconds_count{network="audio_encoder"} 1' in body
@@ -0,0 +1,95 @@
+import numpy as np
+from at16k.api.live_speech_to_text import LiveSpeechToText
+
+
+class FakeLiveModel:
+    """
+    Emits one word per chunk, rewrites the last word every other chunk and ends an utterance every 5 chunks
+    """
+
+    def __call__(self, samples, context=None):
+        if context is None:
+            context = {'chunks': 0, 'words': [], 'finals': []}
+        context['chunks'] += 1
+        if context['chunks'] % 2 == 0 and context['words']:
+            context['words'][-1] = 'fixed%d' % context['chunks']
+        else:
+            context['words'].append('word%d' % context['chunks'])
+        if context['chunks'] % 5 == 0:
+            context['finals'].append(' '.join(context['words']))
+            context['words'] = []
+        return ' '.join(context['words']), context
+
+
+def make_stt():
+    stt = LiveSpeechToText.__new__(LiveSpeechToText)
+    stt._model = FakeLiveModel()
+    stt._scheduler = None
+    return stt
+
+
+def test_events_rebuild_the_transcript():
+    stt = make_stt()
+    context = None
+    events = []
+    for _ in range(12):
+        new_events, context = stt.events_from_buffer(np.zeros(4, dtype=np.float32), context, is_buffer=False)
+        events.extend(new_events)
+    events.extend(stt.finish_events(context))
+
+    assert [event['seq'] for event in events] == list(range(len(events)))
+    finals = []
+    current = ''
+    for event in events:
+        if event['type'] == 'partial':
+            assert event['utterance'] == len(finals)
+            current = current[:event['stable']] + event['tail']
+        else:
+            finals.append(event['text'])
+            current = ''
+    assert finals == ['fixed2 fixed4 word5', 'word6 fixed8 fixed10', 'fixed12']
+    assert [event['type'] for event in events].count('final') == 3
+    # Rewriting the last word only re-sends that word.
+    assert {'type': 'partial', 'seq': 3, 'utterance': 0, 'stable': 7, 'tail': 'fixed4'} in events
+    assert context['event_text'] == '' and stt.finish_events(context) == []
+
+
+class CountingModel:
+    sample_rate = 16000
+
+    def __call__(self, samples, context=None):
+        assert len(samples)
+        context = context or {'samples': 0}
+        context['samples'] += len(samples)
+        return str(context['samples']), context
+
+
+def make_counting_stt():
+    stt = make_stt()
+    stt._model = CountingModel()
+    stt._resamplers = {}
+    return stt
+
+
+def test_buffers_are_resampled_to_the_model_rate():
+    stt = make_counting_stt()
+    # Too short to complete any output: only the resampler state is kept.
+    text, context = stt.from_buffer(np.zeros(2, dtype='<i2').tobytes(), None, sample_rate=8000)
+    assert text == '' and 'samples' not in context
+    for _ in range(10):
+        buffer = np.zeros(800, dtype='<i2').tobytes()
+        text, context = stt.from_buffer(buffer, context, sample_rate=8000)
+    # 16000 samples for 8000 input samples, minus those still waiting for their filter inputs.
+    assert 15950 < context['samples'] < 16004 and text == str(context['samples'])
+    text, context = stt.flush(context)
+    assert text == str(context['samples']) == '16004'
+
+
+def test_resampling_a_stream_started_without_it():
+    stt = make_counting_stt()
+    _, context = stt.from_buffer(np.zeros(100, dtype='<i2').tobytes(), None)
+    text, context = stt.from_buffer(np.zeros(2, dtype='<i2').tobytes(), context, sample_rate=8000)
+    assert text == '' and context['samples'] == 100
+    assert stt.flush(context)[0] == '104'
+    events = stt.finish_events(stt.from_buffer(np.zeros(100, dtype='<i2').tobytes(), None, sample_rate=8000)[1])
+    assert events[-1]['type'] == 'final' and events[-1]['text'] == '200'
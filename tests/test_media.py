@@ -0,0 +1,86 @@
+import numpy as np
+import scipy.io.wavfile as wavfile
+from at16k.core.media import Media
+
+
+def _write(tmpdir, name, data, sample_rate=8000):
+    path = str(tmpdir.join(name))
+    wavfile.write(path, sample_rate, data)
+    return path
+
+
+def _make_samples(num_samples=10000):
+    random = np.random.RandomState(0)
+    return (random.uniform(-0.5, 0.5, num_samples) * np.iinfo(np.int16).max).astype(np.int16)
+
+
+def test_mono_and_stereo_are_scaled_alike(tmpdir):
+    samples = _make_samples()
+    mono = Media(_write(tmpdir, 'mono.wav', samples), dtype=np.float32)
+    stereo = Media(_write(tmpdir, 'stereo.wav', np.stack([samples, samples], axis=1)), dtype=np.float32)
+    for media in [mono, stereo]:
+        assert media.sample_rate == 8000
+        assert media.duration == len(samples) / 8000.
+        assert media.waveform.dtype == np.float32
+        assert np.max(np.abs(media.waveform)) <= 1.
+    np.testing.assert_allclose(stereo.waveform, mono.waveform, atol=1e-6)
+
+
+def test_iter_chunks_matches_waveform(tmpdir):
+    samples = _make_samples()
+    for name, data in [('mono.wav', samples), ('stereo.wav', np.stack([samples, samples], axis=1))]:
+        media = Media(_write(tmpdir, name, data), dtype=np.float32)
+        chunks = list(media.iter_chunks(4096))
+        assert [len(chunk) for chunk in chunks] == [4096, 4096, 1808]
+        assert all(chunk.dtype == np.float32 for chunk in chunks)
+        np.testing.assert_allclose(np.concatenate(chunks), media.waveform, atol=1e-6)
+
+
+def test_raw_waveform_without_dtype(tmpdir):
+    samples = _make_samples()
+    media = Media(_write(tmpdir, 'mono.wav', samples))
+    np.testing.assert_array_equal(media.waveform, samples)
+
+
+def test_resampled_waveform_and_chunks(tmpdir):
+    samples = _make_samples(44100)
+    for dtype in [np.float32, None]:
+        media = Media(_write(tmpdir, 'cd.wav', samples, sample_rate=44100), dtype=dtype, sample_rate=16000)
+        chunks = list(media.iter_chunks(4096))
+        assert media.sample_rate == 16000 and media.duration == 1.
+        assert len(media.waveform) == 16000 and media.waveform.dtype == (dtype or np.int16)
+        assert all(chunk.dtype == media.waveform.dtype for chunk in chunks)
+        np.testing.assert_allclose(np.concatenate(chunks), media.waveform, atol=1e-4 if dtype else 1)
+
+
+def test_streaming_resampler_matches_resample():
+    from at16k.core.media import StreamingResampler, resample
+    samples = np.random.RandomState(0).randn(5000).astype(np.float32)
+    for orig_rate, target_rate in [(8000, 16000), (48000, 16000), (22050, 16000)]:
+        resampler = StreamingResampler(orig_rate, target_rate)
+        state = {}
+        chunks = [resampler(samples[start:(start + 700)], state) for start in range(0, len(samples), 700)]
+        chunks.append(resampler.flush(state))
+        np.testing.assert_allclose(np.concatenate(chunks), resample(samples, orig_rate, target_rate), atol=1e-5)
+
+
+class TrickleStream:
+    """
+    Returns at most 3 bytes per read, like a slow pipe
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size):
+        data, self.data = self.data[:min(size, 3)], self.data[min(size, 3):]
+        return data
+
+
+def test_iter_raw_chunks_reads_whole_chunks():
+    from at16k.core.media import iter_raw_chunks
+    data = np.arange(10, dtype='<i2').tobytes() + b'\x01'
+    chunks = list(iter_raw_chunks(TrickleStream(data), 4))
+    assert [len(chunk) for chunk in chunks] == [8, 8, 4]
+    assert np.array_equal(np.frombuffer(b''.join(chunks), dtype='<i2'), np.arange(10))
+    assert list(iter_raw_chunks(TrickleStream(b''), 4)) == []
@@ -0,0 +1,29 @@
+from at16k.core.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram([1, 5])
+    for value in [0.5, 1, 3, 10]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [(1, 2), (5, 3), ('+Inf', 4)]
+    assert histogram.count == 4 and histogram.sum == 14.5
+
+
+def test_metrics_snapshot_and_prometheus():
+    metrics = Metrics(latency_buckets=[0.01, 0.1])
+    metrics.observe_latency('a', 0.005)
+    metrics.observe_latency('a', 0.05)
+    metrics.observe_latency('j', 0.2)
+    metrics.observe_expansions(4)
+    snapshot = metrics.snapshot()
+    assert snapshot['networks']['a']['count'] == 2
+    assert snapshot['networks']['j']['buckets'][-1] == ('+Inf', 1)
+    assert snapshot['beam_expansions']['sum'] == 4
+
+    text = metrics.to_prometheus()
+    assert 'at16k_network_seconds_bucket{network="audio_encoder",le="0.01"} 1' in text
+    assert 'at16k_network_seconds_count{network="joint_network"} 1' in text
+    assert 'at16k_beam_expansions_count 1' in text
+
+    metrics.reset()
+    assert metrics.snapshot()['networks'] == {}
@@ -0,0 +1,34 @@
+import os
+import numpy as np
+import pytest
+from at16k.core.model import WAVEFORM_GRAPH, WaveformGraph, prepare_waveform_graph
+
+
+def write_saved_model(tf, model_dir):
+    tf_v1 = tf.compat.v1
+    with tf.Graph().as_default() as graph, tf_v1.Session(graph=graph) as session:
+        serialized = tf_v1.placeholder(tf.string, [None], name='input')
+        features = tf_v1.parse_example(serialized, {'waveforms': tf_v1.VarLenFeature(tf.float32)})
+        waveforms = tf.sparse.to_dense(features['waveforms'])
+        scale = tf_v1.get_variable('scale', initializer=2.)
+        scores = tf.reduce_sum(waveforms, axis=1) * scale
+        outputs = tf.cast(waveforms, tf.int64)
+        session.run(tf_v1.global_variables_initializer())
+        builder = tf_v1.saved_model.builder.SavedModelBuilder(os.path.join(model_dir, 'export', '1'))
+        signature = tf_v1.saved_model.signature_def_utils.predict_signature_def(
+            {'input': serialized}, {'outputs': outputs, 'scores': scores})
+        builder.add_meta_graph_and_variables(session, [tf_v1.saved_model.tag_constants.SERVING],
+                                             signature_def_map={'serving_default': signature})
+        builder.save()
+
+
+def test_waveform_graph_from_saved_model(tmpdir):
+    tf = pytest.importorskip('tensorflow')
+    model_dir = str(tmpdir)
+    write_saved_model(tf, model_dir)
+    assert prepare_waveform_graph(model_dir) == os.path.join(model_dir, WAVEFORM_GRAPH)
+    graph = WaveformGraph(os.path.join(model_dir, WAVEFORM_GRAPH))
+    predictions = graph([np.array([1., 2., 3.]), np.array([4.])])
+    graph.close()
+    assert np.allclose(predictions['scores'], [12., 8.])
+    assert predictions['outputs'].tolist() == [[1, 2, 3], [4, 0, 0]]
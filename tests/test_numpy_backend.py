@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from at16k.core.live_inference import LiveInferrer
+from at16k.core.numpy_backend import NumpyGraph, NumpyTextEncoder, UnsupportedGraph
+
+
+def node(name, op, *inputs):
+    return SimpleNamespace(name=name, op=op, input=list(inputs), attr={})
+
+
+def test_numpy_graph_runs_straight_line_ops():
+    graph_def = SimpleNamespace(node=[
+        node('a', 'Placeholder'),
+        node('t', 'Placeholder'),
+        node('sum', 'AddV2', 'a', 't:0'),
+        node('hidden', 'Tanh', 'sum', '^a'),
+        node('probs', 'LogSoftmax', 'hidden'),
+    ])
+    graph = NumpyGraph(graph_def, inputs=['a:0', 't:0'], outputs=['hidden:0', 'probs:0'])
+    a, t = np.random.randn(2, 5), np.random.randn(2, 5)
+    hidden, probs = graph(a, t)
+    assert np.allclose(hidden, np.tanh(a + t))
+    assert np.allclose(np.sum(np.exp(probs), axis=-1), 1.)
+
+    graph_def.node.append(node('loop', 'While', 'a'))
+    with pytest.raises(UnsupportedGraph):
+        NumpyGraph(graph_def, inputs=['a:0'], outputs=['loop:0'])
+
+
+def test_numpy_text_encoder_batches():
+    random = np.random.RandomState(0)
+    units, layers = 4, 2
+    kernels = [random.randn(3 + units, 4 * units), random.randn(2 * units, 4 * units)]
+    encoder = NumpyTextEncoder(random.randn(10, 3), kernels, [random.randn(4 * units) for _ in range(layers)])
+    states = random.randn(layers, 2, 3, units)
+    outputs, outputs_states = encoder([[1], [4], [7]], [1, 1, 1], states)
+    assert outputs.shape == (3, 1, units) and outputs_states.shape == (layers, 2, 3, units)
+    assert np.allclose(outputs[:, 0], outputs_states[-1, 1])
+    for row, token in enumerate([1, 4, 7]):
+        output, output_states = encoder([[token]], [1], states[:, :, row:(row + 1)])
+        assert np.allclose(output, outputs[row:(row + 1)], atol=1e-6)
+        assert np.allclose(output_states, outputs_states[:, :, row:(row + 1)], atol=1e-6)
+
+
+def make_inferrer(network):
+    inferrer = LiveInferrer.__new__(LiveInferrer)
+    inferrer._numpy = {'j': network}
+    inferrer._verified = set()
+    return inferrer
+
+
+def test_numpy_network_is_checked_against_tensorflow():
+    calls = []
+
+    def tf_fn(a, t):
+        calls.append(1)
+        return a + t, a - t
+
+    inferrer = make_inferrer(lambda a, t: [a + t, a - t])
+    for _ in range(3):
+        outputs = inferrer._run_numpy('j', tf_fn, np.ones(2), np.ones(2))
+        assert np.allclose(outputs[0], 2.)
+    assert len(calls) == 1 and 'j' in inferrer._numpy
+
+    inferrer = make_inferrer(lambda a, t: [a + t, a + t])
+    outputs = inferrer._run_numpy('j', tf_fn, np.ones(2), np.ones(2))
+    assert np.allclose(outputs[1], 0.) and 'j' not in inferrer._numpy
+
+
+def test_numpy_graph_matches_tensorflow():
+    tf = pytest.importorskip('tensorflow')
+    tf_v1 = tf.compat.v1
+    random = np.random.RandomState(0)
+    with tf.Graph().as_default() as graph:
+        a_logits = tf_v1.placeholder(tf.float32, [None, 1, 6], name='a_logits')
+        t_logits = tf_v1.placeholder(tf.float32, [None, 1, 6], name='t_logits')
+        hidden = tf.reshape(tf.tanh(a_logits + t_logits), [-1, 6])
+        logits = tf.nn.bias_add(tf.matmul(hidden, random.randn(6, 9).astype(np.float32)),
+                                random.randn(9).astype(np.float32))
+        logits = tf.expand_dims(tf.expand_dims(logits, 1), 2, name='joint_logits')
+        tf.nn.log_softmax(logits, name='joint_log_probs')
+    network = NumpyGraph(graph.as_graph_def(), inputs=['a_logits:0', 't_logits:0'],
+                         outputs=['joint_logits:0', 'joint_log_probs:0'])
+    a, t = random.randn(3, 1, 6).astype(np.float32), random.randn(3, 1, 6).astype(np.float32)
+    with tf_v1.Session(graph=graph) as session:
+        expected = session.run(['joint_logits:0', 'joint_log_probs:0'], feed_dict={a_logits: a, t_logits: t})
+    for output, value in zip(network(a, t), expected):
+        assert np.allclose(output, value, atol=1e-5)
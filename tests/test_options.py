@@ -0,0 +1,30 @@
+import argparse
+from at16k.bin.options import add_live_arguments, live_options
+
+
+def _parser(live_only=False):
+    parser = argparse.ArgumentParser()
+    add_live_arguments(parser, live_only=live_only)
+    return parser
+
+
+def _help(parser, option):
+    return next(action.help for action in parser._actions if option in action.option_strings)
+
+
+def test_live_options():
+    args = _parser().parse_args(['--backend', 'numpy', '--batched-beam', '--fused-graph'])
+    assert live_options(args) == {'batched_beam': True, 'backend': 'numpy', 'fused': True, 'endpoint': None}
+
+
+def test_endpoint_options():
+    args = _parser().parse_args(['--endpoint-windows', '4', '--endpoint-silence', '0.5'])
+    endpoint = live_options(args)['endpoint']
+    assert (endpoint.blank_windows, endpoint.silence) == (4, 0.5)
+
+
+def test_help_of_live_only_commands():
+    assert _help(_parser(), '--backend').startswith('Live models only: run')
+    for option in ('--backend', '--fused-graph', '--endpoint-windows', '--endpoint-silence'):
+        assert _help(_parser(live_only=True), option)[0].isupper()
+        assert 'Live models only' not in _help(_parser(live_only=True), option)
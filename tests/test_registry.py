@@ -0,0 +1,95 @@
+import threading
+import pytest
+from at16k.core.registry import ModelRegistry
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeRegistry(ModelRegistry):
+    """
+    Registry whose models are 100 bytes each and load instantly, unless gated
+    """
+
+    def __init__(self, memory_budget=None):
+        super().__init__(memory_budget=memory_budget)
+        self.loads = []
+        self.gates = {}
+
+    def _load(self, name, live, kwargs):
+        self.loads.append(name)
+        if name in self.gates:
+            self.gates[name].wait()
+        if name == 'broken':
+            raise IOError('model does not exist')
+        return FakeModel(name), 100
+
+
+def test_acquire_shares_instances():
+    registry = FakeRegistry()
+    first = registry.acquire('en_8k')
+    second = registry.acquire('en_8k')
+    live = registry.acquire('en_8k', live=True)
+    assert first is second
+    assert live is not first
+    assert registry.loads == ['en_8k', 'en_8k']
+    assert registry.loaded() == [('offline', 'en_8k', (), 2), ('live', 'en_8k', (), 1)]
+    registry.release(first)
+    registry.release(second)
+    registry.release(live)
+    assert [item[-1] for item in registry.loaded()] == [0, 0]
+
+
+def test_evicts_least_recently_used():
+    registry = FakeRegistry(memory_budget=200)
+    models = {name: registry.acquire(name) for name in ['a', 'b']}
+    registry.release(models['a'])
+    registry.release(models['b'])
+    registry.release(registry.acquire('a'))
+    # 'b' is now the least recently used model.
+    registry.acquire('c')
+    assert [item[1] for item in registry.loaded()] == ['a', 'c']
+    assert models['b'].closed
+    assert not models['a'].closed
+
+
+def test_referenced_models_are_never_evicted():
+    registry = FakeRegistry(memory_budget=100)
+    first = registry.acquire('a')
+    second = registry.acquire('b')
+    assert registry.memory_used == 200
+    assert not first.closed and not second.closed
+    registry.release(first)
+    assert [item[1] for item in registry.loaded()] == ['b']
+    assert first.closed
+
+
+def test_load_does_not_block_other_models():
+    registry = FakeRegistry()
+    loaded = registry.acquire('a')
+    registry.gates['slow'] = threading.Event()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.acquire('slow'))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    # The slow model is still loading, but the loaded one is served right away.
+    assert registry.acquire('a') is loaded
+    registry.release(loaded)
+    registry.gates['slow'].set()
+    for thread in threads:
+        thread.join()
+    assert results[0] is results[1]
+    assert registry.loads.count('slow') == 1
+
+
+def test_failed_load_is_not_cached():
+    registry = FakeRegistry()
+    with pytest.raises(IOError):
+        registry.acquire('broken')
+    assert registry.loaded() == []
@@ -0,0 +1,19 @@
+import numpy as np
+from at16k.blocks.segmenter import Segmenter
+
+
+def test_short_waveform_is_single_segment():
+    waveform = np.ones(8000 * 10, dtype=np.float32)
+    segments = Segmenter(29.5)(waveform, 8000)
+    assert len(segments) == 1
+    assert segments[0].boundaries == (0.0, 10.0)
+
+
+def test_long_waveform_is_cut_at_silence():
+    sample_rate = 8000
+    waveform = np.random.RandomState(0).randn(sample_rate * 100).astype(np.float32)
+    waveform[(sample_rate * 20):(sample_rate * 21)] = 0.
+    segments = Segmenter(29.5)(waveform, sample_rate)
+    assert 20.0 <= segments[0].boundaries[1] <= 21.0
+    assert all(s.boundaries[1] - s.boundaries[0] <= 29.5 for s in segments)
+    assert sum(len(s.waveform) for s in segments) == len(waveform)
@@ -0,0 +1,29 @@
+import numpy as np
+from at16k.api import speech_to_text
+from at16k.api.speech_to_text import SpeechToText
+from at16k.blocks.segmenter import Segmenter
+
+
+class FakeTranscriber:
+
+    def __init__(self, model):
+        pass
+
+    def batch(self, segments, max_batch=16):
+        return [('%d samples' % len(segment.waveform), -1.) for segment in segments]
+
+
+def test_from_waveform_resamples_and_segments(monkeypatch):
+    monkeypatch.setattr(speech_to_text, 'Transcriber', FakeTranscriber)
+    stt = SpeechToText.__new__(SpeechToText)
+    stt._model = None
+    stt._sample_rate = 8000
+    stt._segmenter = None
+    waveform = (np.random.RandomState(0).randn(16000) * 1000).astype(np.int16)
+    result = stt.from_waveform(waveform, sample_rate=16000)
+    assert result['file'] is None and result['sample_rate'] == 8000
+    assert result['text'] == '8000 samples' and result['end'] == 1.
+
+    stt._segmenter = Segmenter(0.5)
+    result = stt.from_waveform(waveform)
+    assert result['end'] == 2. and len(result['segments']) > 1
@@ -0,0 +1,24 @@
+import numpy as np
+from at16k.utils.text_encoder import SubwordTextEncoder
+
+
+def _make_encoder():
+    subtokens = ['<pad>', '<EOS>', 'hel', 'lo_', 'wor', 'ld_', '\\u', '\\92;', 'a', 'b_', '_', '\\\\', '1', '2_']
+    encoder = SubwordTextEncoder()
+    encoder._init_subtokens_from_list(subtokens)
+    encoder._init_alphabet_from_tokens(subtokens)
+    return encoder
+
+
+def test_decode_batch_matches_decode():
+    encoder = _make_encoder()
+    random = np.random.RandomState(0)
+    ids_list = [random.randint(0, encoder.vocab_size + 2, size=random.randint(0, 12)) for _ in range(500)]
+    for strip_extraneous in [True, False]:
+        expected = [encoder.decode(list(ids), strip_extraneous=strip_extraneous) for ids in ids_list]
+        assert encoder.decode_batch(ids_list, strip_extraneous=strip_extraneous) == expected
+
+
+def test_decode_batch_strips_padding():
+    encoder = _make_encoder()
+    assert encoder.decode_batch([np.array([2, 3, 4, 5, 1, 0, 0])], strip_extraneous=True) == ['hello world']
@@ -0,0 +1,34 @@
+import os
+import pytest
+from at16k.core.threads import SHARED_POOL_NAME, ThreadConfig, parse_cpus, session_config, set_cpu_affinity, \
+    split_cpus
+
+
+def test_parse_and_split_cpus():
+    assert parse_cpus('0-3, 8,10-11,') == [0, 1, 2, 3, 8, 10, 11]
+    assert split_cpus(list(range(7)), 3) == [[0, 1, 2], [3, 4], [5, 6]]
+    with pytest.raises(AssertionError):
+        split_cpus([0], 2)
+
+
+def test_default_thread_config_keeps_tensorflow_defaults():
+    assert ThreadConfig() == ThreadConfig(None, None, False)
+    assert {ThreadConfig(1, 1): 'hashable'}[ThreadConfig(intra_op=1, inter_op=1)]
+    assert session_config(None) is None
+    assert session_config(ThreadConfig()) is None
+
+
+def test_session_config():
+    pytest.importorskip('tensorflow')
+    config = session_config(ThreadConfig(intra_op=1, inter_op=2))
+    assert config.intra_op_parallelism_threads == 1 and config.inter_op_parallelism_threads == 2
+    config = session_config(ThreadConfig(inter_op=2, shared_pool=True))
+    assert config.session_inter_op_thread_pool[0].num_threads == 2
+    assert config.session_inter_op_thread_pool[0].global_name == SHARED_POOL_NAME
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'), reason='Linux only')
+def test_set_cpu_affinity():
+    cpus = os.sched_getaffinity(0)
+    set_cpu_affinity(cpus)
+    assert os.sched_getaffinity(0) == cpus
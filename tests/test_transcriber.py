@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from at16k.blocks.transcriber import Transcriber
+from at16k.core.segment import Segment
+
+
+class FakeModel:
+    """
+    Predicts the length of each waveform; waveform_fn fails if broken is set
+    """
+
+    def __init__(self, broken=False):
+        self.calls = []
+        self.waveform_fn = self._waveform_fn if broken else None
+        self.broken = broken
+
+    def _waveform_fn(self, waveforms):
+        raise ValueError('Cannot feed value of shape')
+
+    def disable_waveform_fn(self):
+        self.waveform_fn = None
+
+    def pred_fn(self, features):
+        examples = features['input']
+        self.calls.append(len(examples))
+        return {'outputs': [[len(example)] for example in examples],
+                'scores': [-float(len(example)) for example in examples]}
+
+    @staticmethod
+    def output_batch_fn(outputs, strip_extraneous=False):
+        return [str(output[0]) for output in outputs]
+
+
+def _segments(lengths):
+    return [Segment(waveform=np.zeros(length, dtype=np.float32), boundaries=(0., length / 8000.),
+                    sample_rate=8000, channel=0) for length in lengths]
+
+
+@pytest.fixture(autouse=True)
+def no_examples(monkeypatch):
+    # Examples are only passed through to the fake model.
+    monkeypatch.setattr(Transcriber, '_make_example', staticmethod(lambda waveform: waveform))
+
+
+def test_batch_keeps_input_order():
+    model = FakeModel()
+    lengths = [5, 300, 7, 200, 6, 100, 8]
+    results = Transcriber(model).batch(_segments(lengths), max_batch=3)
+    assert results == [(str(length), -float(length)) for length in lengths]
+    assert model.calls == [3, 3, 1]
+
+
+def test_falls_back_to_examples():
+    model = FakeModel(broken=True)
+    assert Transcriber(model)(_segments([10])[0]) == ('10', -10.)
+    # Only that call falls back: the shared model keeps its waveform graph.
+    assert model.waveform_fn is not None
+    assert Transcriber(model)(_segments([12])[0]) == ('12', -12.)
+    assert model.calls == [1, 1]
+
+
+def test_other_waveform_errors_are_raised():
+    # Matching the exception against TensorFlow's errors imports it.
+    pytest.importorskip('tensorflow')
+    model = FakeModel()
+
+    def waveform_fn(waveforms):
+        raise RuntimeError('session closed')
+
+    model.waveform_fn = waveform_fn
+    with pytest.raises(RuntimeError):
+        Transcriber(model)(_segments([10])[0])
+
+
+def test_waveform_graph(tmpdir):
+    tf = pytest.importorskip('tensorflow')
+    from at16k.core.model import WaveformGraph
+    tf_v1 = tf.compat.v1
+    with tf.Graph().as_default() as graph:
+        waveforms = tf_v1.placeholder(tf.float32, [None, None], name='waveforms')
+        lengths = tf_v1.placeholder(tf.int32, [None], name='lengths')
+        mask = tf.sequence_mask(lengths, tf.shape(waveforms)[1], dtype=tf.float32)
+        sums = tf.reduce_sum(waveforms * mask, axis=1)
+        tf.identity(tf.expand_dims(tf.cast(tf.round(sums), tf.int64), 1), name='outputs')
+        tf.identity(tf.cast(lengths, tf.float32), name='scores')
+    graph_path = str(tmpdir.join('waveform.graph.pb'))
+    with open(graph_path, 'wb') as f:
+        f.write(graph.as_graph_def().SerializeToString())
+    waveform_fn = WaveformGraph(graph_path)
+    predictions = waveform_fn([np.ones(3, dtype=np.float32), np.ones(5, dtype=np.float32)])
+    waveform_fn.close()
+    assert predictions['outputs'].tolist() == [[3], [5]]
+    assert predictions['scores'].tolist() == [3., 5.]